@@ -1,7 +1,197 @@
-import matplotlib.pyplot as plt
+import abc
+import argparse
+import csv
+from collections import OrderedDict
+import numpy as np
+import numpy.typing as npt
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Literal, Optional, Sequence
+from monte_carlo import chunk_seeds, histogram_quantile, imap_chunks
 
 float_list = list[float]
 
+
+class SimuEvent(abc.ABC):
+    """
+    an event watched by the rk45 integrator, a sign change of __call__(t, y, dydt)
+    marks an occurrence, where y and dydt are arrays of susceptible, infected, removed, dead
+    the located occurrence times of the latest run are kept in self.times,
+    it is cleared when a run starts
+    direction: 0 for any crossing, 1 for rising only, -1 for falling only
+    terminal: stop the simulation at the first occurrence
+    """
+    direction: int = 0
+    terminal: bool = False
+    times: float_list
+
+    def __init__(self, terminal: Optional[bool] = None) -> None:
+        if terminal is not None:
+            self.terminal = terminal
+        self.times = []
+
+    @abc.abstractmethod
+    def __call__(self, t: float, y: np.ndarray, dydt: np.ndarray) -> float:
+        ...
+
+
+class InfectedPeak(SimuEvent):
+    """
+    infected stops growing and starts to decrease
+    """
+    direction = -1
+
+    def __call__(self, t: float, y: np.ndarray, dydt: np.ndarray) -> float:
+        return dydt[1]
+
+
+class InfectedBelow(SimuEvent):
+    """
+    infected falls under threshold, terminal by default
+    """
+    direction = -1
+    terminal = True
+
+    def __init__(self, threshold: float = 1., terminal: Optional[bool] = None) -> None:
+        super().__init__(terminal)
+        self.threshold = threshold
+
+    def __call__(self, t: float, y: np.ndarray, dydt: np.ndarray) -> float:
+        return y[1] - self.threshold
+
+
+# Dormand-Prince 5(4) tableau
+_DP_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1])
+_DP_A = [
+    np.array([]),
+    np.array([1/5]),
+    np.array([3/40, 9/40]),
+    np.array([44/45, -56/15, 32/9]),
+    np.array([19372/6561, -25360/2187, 64448/6561, -212/729]),
+    np.array([9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]),
+]
+_DP_B = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+_DP_E = _DP_B - np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40])
+
+
+def _hermite(
+    t0: float, y0: np.ndarray, f0: np.ndarray,
+    t1: float, y1: np.ndarray, f1: np.ndarray,
+    t: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    cubic hermite interpolation of y and dydt inside [t0, t1] at points t
+    """
+    h = t1 - t0
+    u = ((np.asarray(t, dtype=float) - t0) / h)[:, None]
+    h00 = 2 * u**3 - 3 * u**2 + 1
+    h10 = u**3 - 2 * u**2 + u
+    h01 = -2 * u**3 + 3 * u**2
+    h11 = u**3 - u**2
+    y = h00 * y0 + h10 * h * f0 + h01 * y1 + h11 * h * f1
+    dydt = (
+        (6 * u**2 - 6 * u) * (y0 - y1) / h
+        + (3 * u**2 - 4 * u + 1) * f0
+        + (3 * u**2 - 2 * u) * f1
+    )
+    return y, dydt
+
+
+def _locate_event(event: SimuEvent, step: tuple, g0: float, g1: float) -> float:
+    """
+    bisect the dense output of one step for the zero of event
+    """
+    t0, _, _, t1, _, _ = step
+    lo, hi = t0, t1
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        y, dydt = _hermite(*step, np.array([mid]))
+        g = event(mid, y[0], dydt[0])
+        if (g > 0) == (g0 > 0):
+            lo, g0 = mid, g
+        else:
+            hi = mid
+        if hi - lo <= 1e-9 * max(1., abs(hi)):
+            break
+    return hi
+
+
+def _rk45(
+    func: Callable[[np.ndarray], np.ndarray],
+    y0: np.ndarray,
+    t_eval: np.ndarray,
+    rtol: float = 1e-6,
+    atol: float = 1e-6,
+    max_step: float = np.inf,
+    events: Sequence[SimuEvent] = ()
+) -> np.ndarray:
+    """
+    adaptive Dormand-Prince integration of the autonomous system dy/dt = func(y)
+    from t_eval[0] to t_eval[-1], return y sampled at t_eval with shape (len(t_eval), len(y0))
+    the samples are cut short at the first terminal event
+    """
+    for event in events:
+        event.times.clear()
+    out = np.empty((len(t_eval), len(y0)))
+    if len(t_eval) == 0:
+        return out
+    t_end = t_eval[-1]
+    t, y = float(t_eval[0]), np.asarray(y0, dtype=float)
+    f = func(y)
+    out[0] = y
+    n_out = 1
+    g_prev = [event(t, y, f) for event in events]
+
+    scale = atol + rtol * np.abs(y)
+    h = min(max_step, 0.01 * max(np.sqrt(np.mean((y / scale) ** 2)), 1e-5)
+            / max(np.sqrt(np.mean((f / scale) ** 2)), 1e-5))
+    h = max(h, 1e-6)
+    k = np.empty((7, len(y)))
+
+    while t < t_end:
+        h = min(h, max_step, t_end - t)
+        k[0] = f
+        for stage in range(1, 6):
+            k[stage] = func(y + h * (_DP_A[stage] @ k[:stage]))
+        y_new = y + h * (_DP_B[:6] @ k[:6])
+        k[6] = f_new = func(y_new)
+
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = np.sqrt(np.mean((h * (_DP_E @ k) / scale) ** 2))
+        if not np.isfinite(err) or err > 1:
+            h *= max(0.2, 0.9 * err ** -0.2) if np.isfinite(err) else 0.2
+            if h < 1e-12:
+                raise RuntimeError("step size underflow in rk45")
+            continue
+
+        t_new = t + h
+        step = (t, y, f, t_new, y_new, f_new)
+        t_stop = np.inf
+        for n, event in enumerate(events):
+            g = event(t_new, y_new, f_new)
+            g0 = g_prev[n]
+            g_prev[n] = g
+            if (g0 > 0) == (g > 0) or g0 == 0:
+                continue
+            if event.direction and (g > g0) != (event.direction > 0):
+                continue
+            t_event = _locate_event(event, step, g0, g)
+            event.times.append(float(t_event))
+            if event.terminal:
+                t_stop = min(t_stop, t_event)
+
+        n_new = np.searchsorted(t_eval, min(t_new, t_stop), side="right")
+        if n_new > n_out:
+            out[n_out:n_new] = _hermite(*step, t_eval[n_out:n_new])[0]
+            n_out = n_new
+        if t_stop < np.inf:
+            break
+
+        t, y, f = t_new, y_new, f_new
+        h *= min(10., 0.9 * err ** -0.2) if err > 0 else 10.
+
+    return out[:n_out]
+
+
 def simu(
     susceptible: int,
     infected: int,
@@ -11,65 +201,806 @@ def simu(
     growth_rate: float,
     death_rate: float,
     re_infected_rate: float,
-    simu_range: int
+    simu_range: int,
+    method: Literal["euler", "rk45"] = "euler",
+    rtol: float = 1e-6,
+    atol: float = 1e-6,
+    events: Sequence[SimuEvent] = ()
 ) -> tuple[float_list, float_list, float_list, float_list, float_list]:
     """
     return lists of time, susceptible, infected, removed, dead
+    method:
+        - euler: fixed one day explicit step
+        - rk45: adaptive Dormand-Prince step under rtol, atol, sampled back at every day,
+          events (see SimuEvent) record their times and may stop the run early
     """
-    s, i, r = susceptible, infected, removed
-    dead = 0
+    if method == "rk45":
+        return _simu_rk45(
+            susceptible, infected, removed, recover_porpotion, average_contacts,
+            growth_rate, death_rate, re_infected_rate, simu_range, rtol, atol, events
+        )
+    if method != "euler":
+        raise ValueError(f"Unsupported method {method!r}")
+    steps = simu_iter(
+        susceptible, infected, removed, recover_porpotion, average_contacts,
+        growth_rate, death_rate, re_infected_rate, simu_range
+    )
+    return tuple(list(column) for column in zip(*steps)) or ([], [], [], [], [])
+
+def _simu_rk45(
+    susceptible: float,
+    infected: float,
+    removed: float,
+    recover_porpotion: float,
+    average_contacts: float,
+    growth_rate: float,
+    death_rate: float,
+    re_infected_rate: float,
+    simu_range: int,
+    rtol: float,
+    atol: float,
+    events: Sequence[SimuEvent]
+) -> tuple[float_list, float_list, float_list, float_list, float_list]:
     infection_rate = average_contacts * recover_porpotion
     safe_rate = 1 - death_rate
+    population = susceptible + infected + removed
+    births = growth_rate * population / 365
+    reinfection = re_infected_rate * average_contacts
 
-    n = population = s + i + r
-    susceptible_t, infected_t, removed_t, dead_t = [], [], [], []
+    def derivative(y: np.ndarray) -> np.ndarray:
+        s, i, r, _ = y
+        new_infected = infection_rate * s * i / population
+        recovered = recover_porpotion * i
+        re_infected = reinfection * r
+        return np.array([
+            births - new_infected,
+            new_infected - recovered + re_infected,
+            recovered * safe_rate - re_infected,
+            recovered * death_rate
+        ])
 
-    for _ in range(simu_range):
-        susceptible_t.append(susceptible)
-        infected_t.append(infected)
-        removed_t.append(removed)
-        dead_t.append(dead)
+    t_eval = np.arange(simu_range, dtype=float)
+    y = _rk45(
+        derivative, np.array([susceptible, infected, removed, 0.], dtype=float),
+        t_eval, rtol=rtol, atol=atol, events=events
+    )
+    return (
+        list(range(len(y))),
+        y[:, 0].tolist(),
+        y[:, 1].tolist(),
+        y[:, 2].tolist(),
+        y[:, 3].tolist()
+    )
+
+
+def simu_batch(
+    susceptible: npt.ArrayLike,
+    infected: npt.ArrayLike,
+    removed: npt.ArrayLike,
+    recover_porpotion: npt.ArrayLike,
+    average_contacts: npt.ArrayLike,
+    growth_rate: npt.ArrayLike,
+    death_rate: npt.ArrayLike,
+    re_infected_rate: npt.ArrayLike,
+    simu_range: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    vectorized version of simu, advancing every scenario together
+    every argument except simu_range may be a scalar or a 1d array,
+    they are broadcast against each other to n_scenarios
+    return time of shape (simu_range,) and susceptible, infected, removed, dead
+    each of shape (n_scenarios, simu_range)
+    Example
+        >>> T, S, I, R, D = simu_batch(50000, 1000, 0, 1/14, [1, 2], 0., 0.1, 0.01, 200)
+        >>> S.shape
+        (2, 200)
+    """
+    (
+        susceptible, infected, removed, recover_porpotion,
+        average_contacts, growth_rate, death_rate, re_infected_rate
+    ) = np.broadcast_arrays(*(
+        np.atleast_1d(np.asarray(arg, dtype=float)) for arg in (
+            susceptible, infected, removed, recover_porpotion,
+            average_contacts, growth_rate, death_rate, re_infected_rate
+        )
+    ))
+    if susceptible.ndim != 1:
+        raise ValueError("parameters must be scalars or 1d arrays")
+    n_scenarios = susceptible.shape[0]
+
+    s, i, r = susceptible.copy(), infected.copy(), removed.copy()
+    dead = np.zeros(n_scenarios)
+    infection_rate = average_contacts * recover_porpotion
+    safe_rate = 1 - death_rate
+    population = s + i + r
+    births = growth_rate * population / 365
+    reinfection = re_infected_rate * average_contacts
+    infection_per_capita = infection_rate / population
+
+    susceptible_t = np.empty((n_scenarios, simu_range))
+    infected_t = np.empty((n_scenarios, simu_range))
+    removed_t = np.empty((n_scenarios, simu_range))
+    dead_t = np.empty((n_scenarios, simu_range))
 
-        susceptible_delta = - infection_rate * susceptible * infected / population
-        infected_delta = - susceptible_delta - recover_porpotion * infected
-        removed_delta = recover_porpotion * infected * safe_rate
-        death_delta = recover_porpotion * infected * death_rate
+    for day in range(simu_range):
+        susceptible_t[:, day] = s
+        infected_t[:, day] = i
+        removed_t[:, day] = r
+        dead_t[:, day] = dead
 
-        susceptible_delta += growth_rate * population / 365
-        infected_delta += re_infected_rate * removed * average_contacts
-        removed_delta -= re_infected_rate * removed * average_contacts
+        new_infected = infection_per_capita * s * i
+        recovered = recover_porpotion * i
+        re_infected = reinfection * r
 
-        susceptible += susceptible_delta
-        infected += infected_delta
-        removed += removed_delta
-        dead += death_delta
+        s = s - new_infected + births
+        i = i + new_infected - recovered + re_infected
+        r = r + recovered * safe_rate - re_infected
+        dead = dead + recovered * death_rate
 
     return (
-        list(range(simu_range)),
+        np.arange(simu_range),
         susceptible_t,
         infected_t,
         removed_t,
         dead_t
     )
 
-T, S, I, R, D = simu(
-    susceptible=50000,
-    infected=1000,
-    removed=0,
-    recover_porpotion=1/14,
-    average_contacts=1,
-    growth_rate=0.0,
-    death_rate=0.1,
-    re_infected_rate=0.01,
-    simu_range=200
-)
-
-plt.plot(T, S, label='Susceptible')
-plt.plot(T, I, label='Infected')
-plt.plot(T, R, label='Removed')
-plt.plot(T, D, label='Dead')
-
-plt.xlabel('time (days)')
-plt.ylabel('people')
-plt.legend()
-plt.show()
+def _rates(
+    state: np.ndarray,
+    recover_porpotion: float,
+    average_contacts: float,
+    growth_rate: float,
+    death_rate: float,
+    re_infected_rate: float,
+    population: float
+) -> np.ndarray:
+    """
+    propensities of infection, recovery, death, reinfection and birth
+    for states of shape (..., 4), the same transitions as simu
+    """
+    s, i, r = state[..., 0], state[..., 1], state[..., 2]
+    return np.stack(np.broadcast_arrays(
+        average_contacts * recover_porpotion * s * i / population,
+        recover_porpotion * (1 - death_rate) * i,
+        recover_porpotion * death_rate * i,
+        re_infected_rate * average_contacts * r,
+        growth_rate * population / 365
+    ), axis=-1)
+
+
+def _gillespie(
+    state: np.ndarray,
+    params: tuple,
+    simu_range: int,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    exact stochastic simulation of one replicate, return shape (4, simu_range)
+    """
+    recover_porpotion, average_contacts, growth_rate, death_rate, re_infected_rate, population = params
+    infection_per_capita = average_contacts * recover_porpotion / population
+    reinfection = re_infected_rate * average_contacts
+    birth = growth_rate * population / 365
+    s, i, r, dead = (int(x) for x in state)
+    out = np.empty((4, simu_range))
+    t = 0.
+    for day in range(simu_range):
+        while True:
+            infection = infection_per_capita * s * i
+            leaving = recover_porpotion * i
+            re_infection = reinfection * r
+            total = infection + leaving + re_infection + birth
+            if total <= 0:
+                break
+            t += rng.exponential(1 / total)
+            if t > day:
+                break
+            pick = rng.random() * total
+            if pick < infection:
+                s, i = s - 1, i + 1
+            elif pick < infection + leaving:
+                i -= 1
+                if pick < infection + leaving * death_rate:
+                    dead += 1
+                else:
+                    r += 1
+            elif pick < infection + leaving + re_infection:
+                r, i = r - 1, i + 1
+            else:
+                s += 1
+        out[:, day] = s, i, r, dead
+        # memoryless waiting time, redraw from the sampled day on
+        t = day
+    return out
+
+
+def _tau_leap(
+    state: np.ndarray,
+    params: tuple,
+    simu_range: int,
+    tau: float,
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    tau-leaping of many replicates at once from states of shape (n, 4),
+    return shape (n, 4, simu_range)
+    """
+    _, _, _, death_rate, _, _ = params
+    state = state.astype(float)
+    n = state.shape[0]
+    out = np.empty((n, 4, simu_range))
+    steps_per_day = max(1, round(1 / tau))
+    tau = 1 / steps_per_day
+    for day in range(simu_range):
+        out[:, :, day] = state
+        for _ in range(steps_per_day):
+            rates = _rates(state, *params) * tau
+            infections = np.minimum(rng.poisson(rates[:, 0]), state[:, 0])
+            leaving = np.minimum(rng.poisson(rates[:, 1] + rates[:, 2]), state[:, 1])
+            deaths = rng.binomial(leaving.astype(np.int64), death_rate)
+            re_infections = np.minimum(rng.poisson(rates[:, 3]), state[:, 2])
+            births = rng.poisson(rates[:, 4])
+            state[:, 0] += births - infections
+            state[:, 1] += infections + re_infections - leaving
+            state[:, 2] += leaving - deaths - re_infections
+            state[:, 3] += deaths
+    return out
+
+
+def simu_stochastic(
+    susceptible: int,
+    infected: int,
+    removed: int,
+    recover_porpotion: float,
+    average_contacts: int,
+    growth_rate: float,
+    death_rate: float,
+    re_infected_rate: float,
+    simu_range: int,
+    mode: Literal["gillespie", "tau"] = "gillespie",
+    tau: float = 0.1,
+    seed: Optional[int] = None
+) -> tuple[float_list, float_list, float_list, float_list, float_list]:
+    """
+    stochastic counterpart of simu, one replicate with integer people
+    return lists of time, susceptible, infected, removed, dead
+    mode:
+        - gillespie: exact event by event simulation
+        - tau: tau-leaping with a leap of tau days
+    """
+    rng = np.random.default_rng(seed)
+    params = (
+        recover_porpotion, average_contacts, growth_rate,
+        death_rate, re_infected_rate, susceptible + infected + removed
+    )
+    state = np.array([susceptible, infected, removed, 0])
+    if mode == "gillespie":
+        y = _gillespie(state, params, simu_range, rng)
+    elif mode == "tau":
+        y = _tau_leap(state[None], params, simu_range, tau, rng)[0]
+    else:
+        raise ValueError(f"Unsupported mode {mode!r}")
+    return (list(range(simu_range)), *(compartment.tolist() for compartment in y))
+
+
+class EnsembleSummary:
+    """
+    streaming summary of stochastic replicates, merged chunk by chunk
+    Instance Attributes:
+        - n: number of replicates seen
+        - extinct: number of replicates with no infected left on the last day
+        - total: per day sums of susceptible, infected, removed, dead, shape (4, simu_range)
+        - histogram: per day counts of infected over bin_edges, shape (simu_range, bins)
+    """
+    n: int
+    extinct: int
+    total: np.ndarray
+    histogram: np.ndarray
+    bin_edges: np.ndarray
+
+    def __init__(self, simu_range: int, bin_edges: np.ndarray) -> None:
+        self.n = 0
+        self.extinct = 0
+        self.total = np.zeros((4, simu_range))
+        self.bin_edges = bin_edges
+        self.histogram = np.zeros((simu_range, len(bin_edges) - 1), dtype=np.int64)
+
+    def add(self, trajectories: np.ndarray) -> None:
+        """
+        fold trajectories of shape (n, 4, simu_range) into the summary
+        """
+        self.n += trajectories.shape[0]
+        self.extinct += int(np.count_nonzero(trajectories[:, 1, -1] == 0))
+        self.total += trajectories.sum(axis=0)
+        bins = len(self.bin_edges) - 1
+        index = np.clip(np.searchsorted(self.bin_edges, trajectories[:, 1, :], side="right") - 1, 0, bins - 1)
+        days = np.broadcast_to(np.arange(index.shape[1]), index.shape)
+        np.add.at(self.histogram, (days, index), 1)
+
+    def merge(self, other: "EnsembleSummary") -> None:
+        self.n += other.n
+        self.extinct += other.extinct
+        self.total += other.total
+        self.histogram += other.histogram
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        per day mean of susceptible, infected, removed, dead, shape (4, simu_range)
+        """
+        return self.total / max(self.n, 1)
+
+    @property
+    def extinction_fraction(self) -> float:
+        return self.extinct / max(self.n, 1)
+
+    def infected_quantile(self, q: npt.ArrayLike) -> np.ndarray:
+        """
+        per day quantiles of infected, resolved to the histogram bins,
+        shape (len(q), simu_range)
+        """
+        return histogram_quantile(self.histogram, self.bin_edges, q)
+
+
+def _ensemble_chunk(
+    state: np.ndarray,
+    params: tuple,
+    simu_range: int,
+    mode: str,
+    tau: float,
+    n: int,
+    seed: np.random.SeedSequence,
+    bin_edges: np.ndarray
+) -> EnsembleSummary:
+    rng = np.random.default_rng(seed)
+    if mode == "tau":
+        trajectories = _tau_leap(np.tile(state, (n, 1)), params, simu_range, tau, rng)
+    else:
+        trajectories = np.stack([_gillespie(state, params, simu_range, rng) for _ in range(n)])
+    summary = EnsembleSummary(simu_range, bin_edges)
+    summary.add(trajectories)
+    return summary
+
+
+def simu_ensemble(
+    susceptible: int,
+    infected: int,
+    removed: int,
+    recover_porpotion: float,
+    average_contacts: int,
+    growth_rate: float,
+    death_rate: float,
+    re_infected_rate: float,
+    simu_range: int,
+    n_replicates: int,
+    mode: Literal["gillespie", "tau"] = "tau",
+    tau: float = 0.1,
+    seed: Optional[int] = None,
+    processes: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    bins: int = 256
+) -> Iterator[EnsembleSummary]:
+    """
+    run n_replicates independent seeded replicates of simu_stochastic on a process pool,
+    yield the running EnsembleSummary every time a chunk of chunk_size replicates completes,
+    only a few chunks are in flight at a time so memory does not grow with n_replicates
+    processes: pool size, None for one process per CPU, 0 runs everything in the current process
+    chunk_size: 4096 for tau, whose steps are vectorized over the chunk, 64 for gillespie by default
+    Example
+        >>> for summary in simu_ensemble(500, 5, 0, 1/14, 2, 0., 0.1, 0., 100, 1000, seed=1, processes=0):
+        ...     pass
+        >>> summary.n, summary.mean.shape
+        (1000, (4, 100))
+
+        a lone infected person leaves dead with probability death_rate
+        >>> for summary in simu_ensemble(0, 1, 0, 1., 0, 0., 0.5, 0., 30, 2000, "gillespie", seed=0, processes=0):
+        ...     pass
+        >>> round(float(summary.mean[3, -1]), 1)
+        0.5
+    """
+    if mode not in ("gillespie", "tau"):
+        raise ValueError(f"Unsupported mode {mode!r}")
+    population = susceptible + infected + removed
+    params = (
+        recover_porpotion, average_contacts, growth_rate,
+        death_rate, re_infected_rate, population
+    )
+    state = np.array([susceptible, infected, removed, 0])
+    upper = population * (1 + max(growth_rate, 0) * simu_range / 365) + 1
+    bin_edges = np.linspace(0, upper, bins + 1)
+
+    if chunk_size is None:
+        chunk_size = 4096 if mode == "tau" else 64
+    summary = EnsembleSummary(simu_range, bin_edges)
+    chunk_args = (
+        (state, params, simu_range, mode, tau, size, chunk_seed, bin_edges)
+        for size, chunk_seed in chunk_seeds(n_replicates, chunk_size, seed)
+    )
+    for chunk in imap_chunks(_ensemble_chunk, chunk_args, processes):
+        summary.merge(chunk)
+        yield summary
+
+
+def _sparse_matvec(mobility: tuple[np.ndarray, np.ndarray, np.ndarray], x: np.ndarray) -> np.ndarray:
+    """
+    y[target] = sum of weight * x[source] over the links of mobility
+    """
+    target, source, weight = mobility
+    return np.bincount(target, weights=weight * x[source], minlength=x.shape[0])
+
+
+def simu_meta(
+    susceptible: npt.ArrayLike,
+    infected: npt.ArrayLike,
+    removed: npt.ArrayLike,
+    recover_porpotion: npt.ArrayLike,
+    average_contacts: npt.ArrayLike,
+    growth_rate: npt.ArrayLike,
+    death_rate: npt.ArrayLike,
+    re_infected_rate: npt.ArrayLike,
+    mobility: tuple[npt.ArrayLike, npt.ArrayLike, npt.ArrayLike],
+    simu_range: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    metapopulation version of simu over connected regions
+    every state and parameter is a scalar or an array of n_regions
+    mobility: sparse links as (target, source, weight) arrays, region target
+    mixes with residents of region source at weight relative to its own residents,
+    so the infection pressure on region j is
+        infection_rate_j * S_j * (I_j + sum_k w_jk I_k) / (N_j + sum_k w_jk N_k)
+    with no links every region follows simu on its own
+    return time of shape (simu_range,) and susceptible, infected, removed, dead
+    each of shape (n_regions, simu_range)
+    Example
+        >>> links = ([0, 1], [1, 0], [0.1, 0.1])
+        >>> T, S, I, R, D = simu_meta([50000, 20000], [1000, 0], 0, 1/14, 1, 0., 0.1, 0.01, links, 200)
+        >>> I.shape
+        (2, 200)
+    """
+    (
+        susceptible, infected, removed, recover_porpotion,
+        average_contacts, growth_rate, death_rate, re_infected_rate
+    ) = np.broadcast_arrays(*(
+        np.atleast_1d(np.asarray(arg, dtype=float)) for arg in (
+            susceptible, infected, removed, recover_porpotion,
+            average_contacts, growth_rate, death_rate, re_infected_rate
+        )
+    ))
+    if susceptible.ndim != 1:
+        raise ValueError("parameters must be scalars or 1d arrays")
+    n_regions = susceptible.shape[0]
+    target, source, weight = (np.asarray(a) for a in mobility)
+    mobility = (target.astype(np.intp), source.astype(np.intp), weight.astype(float))
+    if target.size and (max(target.max(), source.max()) >= n_regions or min(target.min(), source.min()) < 0):
+        raise ValueError("mobility links refer to regions out of range")
+
+    s, i, r = susceptible.copy(), infected.copy(), removed.copy()
+    dead = np.zeros(n_regions)
+    infection_rate = average_contacts * recover_porpotion
+    safe_rate = 1 - death_rate
+    population = s + i + r
+    births = growth_rate * population / 365
+    reinfection = re_infected_rate * average_contacts
+    mixing_population = population + _sparse_matvec(mobility, population)
+    infection_per_capita = infection_rate / mixing_population
+
+    susceptible_t = np.empty((n_regions, simu_range))
+    infected_t = np.empty((n_regions, simu_range))
+    removed_t = np.empty((n_regions, simu_range))
+    dead_t = np.empty((n_regions, simu_range))
+
+    for day in range(simu_range):
+        susceptible_t[:, day] = s
+        infected_t[:, day] = i
+        removed_t[:, day] = r
+        dead_t[:, day] = dead
+
+        new_infected = infection_per_capita * s * (i + _sparse_matvec(mobility, i))
+        recovered = recover_porpotion * i
+        re_infected = reinfection * r
+
+        s = s - new_infected + births
+        i = i + new_infected - recovered + re_infected
+        r = r + recovered * safe_rate - re_infected
+        dead = dead + recovered * death_rate
+
+    return (
+        np.arange(simu_range),
+        susceptible_t,
+        infected_t,
+        removed_t,
+        dead_t
+    )
+
+
+FIT_PARAMETERS = ("recover_porpotion", "average_contacts", "death_rate", "re_infected_rate")
+DEFAULT_FIT_BOUNDS: dict[str, tuple[float, float]] = {
+    "recover_porpotion": (1e-3, 1.),
+    "average_contacts": (0., 20.),
+    "death_rate": (0., 1.),
+    "re_infected_rate": (0., 0.1),
+}
+
+
+class SimuCache:
+    """
+    bounded LRU memo of losses keyed by parameter vectors rounded to decimals
+    Instance Attributes:
+        - hits, misses: lookup statistics
+    """
+    hits: int
+    misses: int
+
+    def __init__(self, maxsize: int = 1 << 20, decimals: int = 8) -> None:
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.hits = self.misses = 0
+        self._store: OrderedDict[bytes, float] = OrderedDict()
+
+    def evaluate(self, candidates: np.ndarray, loss: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        losses of candidates of shape (n, n_params), only the unseen rows reach loss
+        """
+        candidates = np.round(candidates, self.decimals)
+        keys = [row.tobytes() for row in candidates]
+        result = np.empty(len(keys))
+        missing: dict[bytes, list[int]] = {}
+        for n, key in enumerate(keys):
+            value = self._store.get(key)
+            if value is None:
+                missing.setdefault(key, []).append(n)
+            else:
+                self._store.move_to_end(key)
+                result[n] = value
+                self.hits += 1
+        if missing:
+            rows = [rows[0] for rows in missing.values()]
+            values = loss(candidates[rows])
+            self.misses += len(rows)
+            for (key, where), value in zip(missing.items(), values):
+                result[where] = value
+                self._store[key] = float(value)
+            while len(self._store) > self.maxsize:
+                self._store.popitem(last=False)
+        return result
+
+
+def simu_loss(
+    candidates: np.ndarray,
+    observed_infected: np.ndarray,
+    observed_dead: Optional[np.ndarray],
+    susceptible: float,
+    infected: float,
+    removed: float,
+    growth_rate: float,
+    loss: Literal["squares", "poisson"] = "squares"
+) -> np.ndarray:
+    """
+    loss of every row of candidates, columns ordered as FIT_PARAMETERS,
+    against the observed series, all rows simulated together by simu_batch
+    """
+    recover_porpotion, average_contacts, death_rate, re_infected_rate = candidates.T
+    with np.errstate(all="ignore"):
+        _, _, I, _, D = simu_batch(
+            susceptible, infected, removed, recover_porpotion, average_contacts,
+            growth_rate, death_rate, re_infected_rate, len(observed_infected)
+        )
+    pairs = [(I, observed_infected)]
+    if observed_dead is not None:
+        pairs.append((D, observed_dead))
+    total = np.zeros(len(candidates))
+    with np.errstate(all="ignore"):
+        for simulated, observed in pairs:
+            if loss == "squares":
+                total += ((simulated - observed) ** 2).sum(axis=1)
+            elif loss == "poisson":
+                simulated = np.maximum(simulated, 1e-9)
+                total += (simulated - observed * np.log(simulated)).sum(axis=1)
+            else:
+                raise ValueError(f"Unsupported loss {loss!r}")
+    return np.where(np.isfinite(total), total, np.inf)
+
+
+def _fit_start(
+    loss_args: tuple,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    population_size: int,
+    generations: int,
+    seed: np.random.SeedSequence
+) -> tuple[np.ndarray, float]:
+    """
+    one differential evolution search inside the bounds, return best candidate and its loss
+    """
+    rng = np.random.default_rng(seed)
+    cache = SimuCache()
+    evaluate = lambda candidates: simu_loss(candidates, *loss_args)
+    n_params = len(lower)
+    population = rng.uniform(lower, upper, (population_size, n_params))
+    losses = cache.evaluate(population, evaluate)
+    for _ in range(generations):
+        best = population[np.argmin(losses)]
+        picks = rng.integers(0, population_size, (2, population_size))
+        scale = rng.uniform(0.5, 1., (population_size, 1))
+        mutant = population + scale * (best - population + population[picks[0]] - population[picks[1]])
+        crossover = rng.random((population_size, n_params)) < 0.9
+        crossover[np.arange(population_size), rng.integers(0, n_params, population_size)] = True
+        trial = np.clip(np.where(crossover, mutant, population), lower, upper)
+        trial_losses = cache.evaluate(trial, evaluate)
+        improved = trial_losses <= losses
+        population[improved] = trial[improved]
+        losses[improved] = trial_losses[improved]
+        if np.all(np.ptp(population, axis=0) <= 1e-9 * (upper - lower)):
+            break
+    n = np.argmin(losses)
+    return population[n], float(losses[n])
+
+
+def fit_simu(
+    observed_infected: npt.ArrayLike,
+    susceptible: float,
+    infected: float,
+    removed: float,
+    growth_rate: float = 0.,
+    observed_dead: Optional[npt.ArrayLike] = None,
+    bounds: Optional[dict[str, tuple[float, float]]] = None,
+    loss: Literal["squares", "poisson"] = "squares",
+    n_starts: int = 4,
+    processes: Optional[int] = None,
+    population_size: int = 64,
+    generations: int = 300,
+    seed: Optional[int] = None
+) -> tuple[dict[str, float], float]:
+    """
+    fit FIT_PARAMETERS of simu to observed daily infected (and dead) series
+    each start is a differential evolution search whose every generation is one
+    simu_batch call, repeated candidates are answered from a SimuCache,
+    the n_starts searches run on a process pool, processes as in simu_ensemble
+    bounds default to DEFAULT_FIT_BOUNDS
+    return the best parameters and their loss
+    Example
+        >>> _, _, I, _, D = simu(50000, 1000, 0, 1/14, 2, 0., 0.1, 0.01, 100)
+        >>> params, _ = fit_simu(I, 50000, 1000, 0, observed_dead=D, seed=0, processes=0)
+        >>> round(params["average_contacts"], 2)
+        2.0
+    """
+    bounds = {**DEFAULT_FIT_BOUNDS, **(bounds or {})}
+    lower = np.array([bounds[name][0] for name in FIT_PARAMETERS], dtype=float)
+    upper = np.array([bounds[name][1] for name in FIT_PARAMETERS], dtype=float)
+    observed_infected = np.asarray(observed_infected, dtype=float)
+    if observed_dead is not None:
+        observed_dead = np.asarray(observed_dead, dtype=float)
+    loss_args = (observed_infected, observed_dead, susceptible, infected, removed, growth_rate, loss)
+    start_args = [
+        (loss_args, lower, upper, population_size, generations, start_seed)
+        for start_seed in np.random.SeedSequence(seed).spawn(n_starts)
+    ]
+    if processes == 0:
+        results = [_fit_start(*args) for args in start_args]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_fit_start, *zip(*start_args)))
+    best, best_loss = min(results, key=lambda result: result[1])
+    return dict(zip(FIT_PARAMETERS, best.tolist())), best_loss
+
+
+def simu_iter(
+    susceptible: float,
+    infected: float,
+    removed: float,
+    recover_porpotion: float,
+    average_contacts: float,
+    growth_rate: float,
+    death_rate: float,
+    re_infected_rate: float,
+    simu_range: Optional[int] = None
+) -> Iterator[tuple[int, float, float, float, float]]:
+    """
+    generator version of simu, yield time, susceptible, infected, removed, dead one day at a time
+    runs forever when simu_range is None
+    Example
+        >>> steps = simu_iter(50000, 1000, 0, 1/14, 1, 0., 0.1, 0.01)
+        >>> next(steps)
+        (0, 50000, 1000, 0, 0)
+    """
+    dead = 0
+    infection_rate = average_contacts * recover_porpotion
+    safe_rate = 1 - death_rate
+    population = susceptible + infected + removed
+    births = growth_rate * population / 365
+    reinfection = re_infected_rate * average_contacts
+
+    t = 0
+    while simu_range is None or t < simu_range:
+        yield t, susceptible, infected, removed, dead
+
+        new_infected = infection_rate * susceptible * infected / population
+        recovered = recover_porpotion * infected
+        re_infected = reinfection * removed
+
+        susceptible = susceptible - new_infected + births
+        infected = infected + new_infected - recovered + re_infected
+        removed = removed + recovered * safe_rate - re_infected
+        dead = dead + recovered * death_rate
+        t += 1
+
+
+def write_simu(path: str, steps: Iterator[tuple], simu_range: int) -> None:
+    """
+    write simu_iter steps to path without holding them in memory
+    .npy is written through a memory map of shape (simu_range, 5), .csv row by row
+    """
+    if path.endswith(".npy"):
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(simu_range, 5))
+        for row, step in zip(range(simu_range), steps):
+            out[row] = step
+        out.flush()
+        del out
+    elif path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time", "susceptible", "infected", "removed", "dead"])
+            for _, step in zip(range(simu_range), steps):
+                writer.writerow(step)
+    else:
+        raise ValueError(f"Unsupported output format {path!r}, use .npy or .csv")
+
+
+def plot_simu(
+    T: Sequence[float],
+    S: Sequence[float],
+    I: Sequence[float],
+    R: Sequence[float],
+    D: Sequence[float],
+    save_path: Optional[str] = None
+) -> None:
+    """
+    plot the output of simu, matplotlib is only imported here
+    shows the figure unless save_path is given
+    """
+    import matplotlib.pyplot as plt
+
+    plt.plot(T, S, label='Susceptible')
+    plt.plot(T, I, label='Infected')
+    plt.plot(T, R, label='Removed')
+    plt.plot(T, D, label='Dead')
+
+    plt.xlabel('time (days)')
+    plt.ylabel('people')
+    plt.legend()
+    if save_path is None:
+        plt.show()
+    else:
+        plt.savefig(save_path)
+        plt.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="SIR model simulation")
+    parser.add_argument("--susceptible", type=float, default=50000)
+    parser.add_argument("--infected", type=float, default=1000)
+    parser.add_argument("--removed", type=float, default=0)
+    parser.add_argument("--recover-porpotion", type=float, default=1/14)
+    parser.add_argument("--average-contacts", type=float, default=1)
+    parser.add_argument("--growth-rate", type=float, default=0.0)
+    parser.add_argument("--death-rate", type=float, default=0.1)
+    parser.add_argument("--re-infected-rate", type=float, default=0.01)
+    parser.add_argument("--simu-range", type=int, default=200)
+    parser.add_argument(
+        "-o", "--output",
+        help="write time, S, I, R, D to a .npy or .csv file instead of plotting"
+    )
+    args = parser.parse_args(argv)
+
+    params = (
+        args.susceptible, args.infected, args.removed, args.recover_porpotion,
+        args.average_contacts, args.growth_rate, args.death_rate, args.re_infected_rate
+    )
+    if args.output:
+        write_simu(args.output, simu_iter(*params), args.simu_range)
+    else:
+        plot_simu(*simu(*params, args.simu_range))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,10 @@
+import array
+import contextlib
+import decimal
+import functools
 import math
+import numbers
+import re
 import numpy as np
 import typing
 from typing import Literal, Sequence, Optional, Union
@@ -6,6 +12,8 @@ import numpy.typing as npt
 from decimal import Decimal
 from fractions import Fraction
 
+import root_finding
+
 
 _legalNumType = [Decimal, Fraction, float, int]
 LegalNumType = Union[Decimal, Fraction, float, int]
@@ -16,17 +24,47 @@ class Multi3D:
     k = np.array([0, 0, 1])
 
     @staticmethod
-    def cross(v1: Sequence, v2: Sequence) -> np.ndarray:
-        return np.array([
-            v1[1] * v2[2] - v1[2] * v2[1],
-            v1[2] * v2[0] - v1[0] * v2[2],
-            v1[0] * v2[1] - v1[1] * v2[0]
-        ])
+    def cross(v1: npt.ArrayLike, v2: npt.ArrayLike, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        cross product of two vectors, or row by row for (N, 3) arrays,
+        a single vector is broadcast against every row of the other
+        out: preallocated result of the broadcast shape, must not overlap v1 or v2
+        """
+        if out is None and np.ndim(v1) == 1 and np.ndim(v2) == 1:
+            return np.array([
+                v1[1] * v2[2] - v1[2] * v2[1],
+                v1[2] * v2[0] - v1[0] * v2[2],
+                v1[0] * v2[1] - v1[1] * v2[0]
+            ])
+        a, b = np.asarray(v1), np.asarray(v2)
+        if a.shape[-1] != 3 or b.shape[-1] != 3:
+            raise ValueError("cross product needs vectors of length 3")
+        shape = np.broadcast_shapes(a.shape, b.shape)
+        if out is None:
+            out = np.empty(shape, dtype=np.result_type(a, b))
+        elif out.shape != shape:
+            raise ValueError(f"out has shape {out.shape}, expected {shape}")
+        scratch = np.empty(shape[:-1], dtype=out.dtype)
+        for n, (p, q) in enumerate(((1, 2), (2, 0), (0, 1))):
+            np.multiply(a[..., p], b[..., q], out=out[..., n])
+            np.multiply(a[..., q], b[..., p], out=scratch)
+            np.subtract(out[..., n], scratch, out=out[..., n])
+        return out
 
     @staticmethod
-    def dot(v1: Sequence, v2: Sequence) -> float:
-        assert len(v1) == len(v2)
-        return sum(_a * _b for _a, _b in zip(v1, v2))
+    def dot(v1: npt.ArrayLike, v2: npt.ArrayLike, out: Optional[np.ndarray] = None) -> Union[float, np.ndarray]:
+        """
+        dot product of two vectors, or row by row for (N, 3) arrays giving shape (N,),
+        a single vector is broadcast against every row of the other
+        out: preallocated result of shape (N,)
+        """
+        if out is None and np.ndim(v1) == 1 and np.ndim(v2) == 1:
+            assert len(v1) == len(v2)
+            return sum(_a * _b for _a, _b in zip(v1, v2))
+        a, b = np.asarray(v1), np.asarray(v2)
+        if a.shape[-1] != b.shape[-1]:
+            raise ValueError(f"vectors of length {a.shape[-1]} and {b.shape[-1]}")
+        return np.einsum("...i,...i->...", a, b, out=out)
 
     @ staticmethod
     def execute():
@@ -43,64 +81,996 @@ class Multi3D:
         return np.array([0] * dim)
     
 
+class Vec3(tuple):
+    """
+    immutable 3d vector for scalar work without numpy allocation
+    being a tuple, it is also accepted wherever Multi3D expects a Sequence
+    Example
+        >>> Vec3(1, 0, 0).cross(Vec3(0, 1, 0))
+        Vec3(0, 0, 1)
+        >>> (Vec3(1, 2, 3) + Vec3(1, 1, 1)).dot(Vec3(1, 0, 0))
+        2
+        >>> sum([Vec3(1, 2, 3), Vec3(1, 1, 1)])
+        Vec3(2, 3, 4)
+        >>> Vec3(1, 2, 3) * 2.
+        Vec3(2.0, 4.0, 6.0)
+    """
+    __slots__ = ()
+    # numpy would take the tuple as an array, make np.float64(2) * v call __rmul__ instead
+    __array_ufunc__ = None
+
+    def __new__(cls, x: float = 0., y: float = 0., z: float = 0.) -> "Vec3":
+        return tuple.__new__(cls, (x, y, z))
+
+    x = property(lambda self: self[0])
+    y = property(lambda self: self[1])
+    z = property(lambda self: self[2])
+
+    def __repr__(self) -> str:
+        return f"Vec3({self[0]!r}, {self[1]!r}, {self[2]!r})"
+
+    def __add__(self, other: Sequence) -> "Vec3":
+        return Vec3(self[0] + other[0], self[1] + other[1], self[2] + other[2])
+
+    def __radd__(self, other: Sequence) -> "Vec3":
+        # sum() starts from 0
+        if isinstance(other, numbers.Number) and other == 0:
+            return self
+        return self + other
+
+    def __sub__(self, other: Sequence) -> "Vec3":
+        return Vec3(self[0] - other[0], self[1] - other[1], self[2] - other[2])
+
+    def __rsub__(self, other: Sequence) -> "Vec3":
+        return Vec3(other[0] - self[0], other[1] - self[1], other[2] - self[2])
+
+    def __neg__(self) -> "Vec3":
+        return Vec3(-self[0], -self[1], -self[2])
+
+    def __mul__(self, scalar: float) -> "Vec3":
+        # a tuple would repeat itself on Vec3 * Vec3
+        if not isinstance(scalar, numbers.Number):
+            return NotImplemented
+        return Vec3(self[0] * scalar, self[1] * scalar, self[2] * scalar)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, scalar: float) -> "Vec3":
+        if not isinstance(scalar, numbers.Number):
+            return NotImplemented
+        return Vec3(self[0] / scalar, self[1] / scalar, self[2] / scalar)
+
+    def dot(self, other: Sequence) -> float:
+        return self[0] * other[0] + self[1] * other[1] + self[2] * other[2]
+
+    def cross(self, other: Sequence) -> "Vec3":
+        x1, y1, z1 = self
+        x2, y2, z2 = other
+        return Vec3(y1 * z2 - z1 * y2, z1 * x2 - x1 * z2, x1 * y2 - y1 * x2)
+
+    def norm(self) -> float:
+        return math.sqrt(self[0] * self[0] + self[1] * self[1] + self[2] * self[2])
+
+    __abs__ = norm
+
+    def normalized(self) -> "Vec3":
+        return self / self.norm()
+
+
+class Vec3Array:
+    """
+    many 3d vectors in one contiguous float64 buffer
+    backed either by a growable array.array or, after from_numpy, by the memory
+    of a numpy array, in which case appending first copies into an array.array
+    Example
+        >>> vectors = Vec3Array([Vec3(1, 2, 3), Vec3(4, 5, 6)])
+        >>> vectors.to_numpy()
+        array([[1., 2., 3.],
+               [4., 5., 6.]])
+        >>> vectors[1]
+        Vec3(4.0, 5.0, 6.0)
+    """
+    __slots__ = ("_data",)
+    _data: Union[array.array, memoryview]
+
+    def __init__(self, vectors: typing.Iterable[Sequence] = ()) -> None:
+        self._data = array.array("d")
+        for vector in vectors:
+            self._data.extend(vector[:3])
+
+    @classmethod
+    def from_numpy(cls, arr: np.ndarray) -> "Vec3Array":
+        """
+        share the memory of a C-contiguous float64 array of shape (N, 3)
+        """
+        if arr.dtype != np.float64 or arr.ndim != 2 or arr.shape[1] != 3 or not arr.flags.c_contiguous:
+            raise ValueError("expected a C-contiguous float64 array of shape (N, 3)")
+        vectors = cls.__new__(cls)
+        vectors._data = memoryview(arr).cast("B").cast("d")
+        return vectors
+
+    def to_numpy(self) -> np.ndarray:
+        """
+        (N, 3) view of the buffer, resizing an array.array backed Vec3Array
+        is refused while the view is alive
+        """
+        return np.frombuffer(self._data, dtype=np.float64).reshape(-1, 3)
+
+    def __len__(self) -> int:
+        return len(self._data) // 3
+
+    def __getitem__(self, n: int) -> Vec3:
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("Vec3Array index out of range")
+        data = self._data
+        return Vec3(data[3 * n], data[3 * n + 1], data[3 * n + 2])
+
+    def __setitem__(self, n: int, vector: Sequence) -> None:
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("Vec3Array index out of range")
+        self._data[3 * n:3 * n + 3] = array.array("d", vector[:3])
+
+    def __iter__(self) -> typing.Iterator[Vec3]:
+        data = self._data
+        for n in range(0, len(data), 3):
+            yield Vec3(data[n], data[n + 1], data[n + 2])
+
+    def append(self, vector: Sequence) -> None:
+        if isinstance(self._data, memoryview):
+            self._data = array.array("d", self._data)
+        self._data.extend(vector[:3])
+
+
+# name: (exact scalar implementation, numpy implementation)
+_FUNCTIONS: dict[str, tuple[typing.Callable, str]] = {
+    "sin": (math.sin, "np.sin"),
+    "cos": (math.cos, "np.cos"),
+    "tan": (math.tan, "np.tan"),
+    "asin": (math.asin, "np.arcsin"),
+    "acos": (math.acos, "np.arccos"),
+    "atan": (math.atan, "np.arctan"),
+    "sinh": (math.sinh, "np.sinh"),
+    "cosh": (math.cosh, "np.cosh"),
+    "tanh": (math.tanh, "np.tanh"),
+    "exp": (math.exp, "np.exp"),
+    "log": (math.log, "np.log"),
+    "sqrt": (math.sqrt, "np.sqrt"),
+    "abs": (abs, "np.abs"),
+}
+_CONSTANTS: dict[str, float] = {"pi": math.pi, "e": math.e}
+_BINARY_OPS: dict[str, typing.Callable] = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": lambda a, b: a / b,
+    "^": lambda a, b: a ** b,
+}
+# binding strength when rendering, higher binds tighter
+_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2, "neg": 3, "^": 4}
+
+
+class ExprNode:
+    """
+    immutable node of an expression tree
+    Instance Attributes:
+        - op
+        "num", "var", "const", "neg", one of + - * / ^, or a function name in _FUNCTIONS
+        - args
+        (value,) for num, (name,) for var and const, child nodes otherwise
+    """
+    __slots__ = ("op", "args", "_hash", "_variables")
+    op: str
+    args: tuple
+
+    def __init__(self, op: str, args: tuple) -> None:
+        object.__setattr__(self, "op", op)
+        object.__setattr__(self, "args", args)
+        object.__setattr__(self, "_hash", hash((op, args)))
+        object.__setattr__(self, "_variables", None)
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("ExprNode is immutable")
+
+    def __eq__(self, other: object) -> bool:
+        return self is other or (
+            isinstance(other, ExprNode) and self._hash == other._hash
+            and self.op == other.op and self.args == other.args
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"ExprNode({self.op!r}, {self.args!r})"
+
+    def __str__(self) -> str:
+        return _render(self)
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.op in ("num", "var", "const")
+
+    @property
+    def variables(self) -> frozenset[str]:
+        if self._variables is None:
+            if self.op == "var":
+                variables = frozenset(self.args)
+            elif self.is_leaf:
+                variables = frozenset()
+            else:
+                variables = frozenset().union(*(arg.variables for arg in self.args))
+            object.__setattr__(self, "_variables", variables)
+        return self._variables
+
+
+# interned number nodes of small integers and rationals, keyed by type and value
+_SMALL_NUMBERS: dict[tuple[type, LegalNumType], ExprNode] = {}
+_SMALL_LIMIT = 1 << 10
+
+
+def _num(value: LegalNumType) -> ExprNode:
+    if isinstance(value, Fraction):
+        small = abs(value.numerator) <= _SMALL_LIMIT and value.denominator <= _SMALL_LIMIT
+    else:
+        small = type(value) is int and abs(value) <= _SMALL_LIMIT
+    if not small:
+        return ExprNode("num", (value,))
+    key = (type(value), value)
+    node = _SMALL_NUMBERS.get(key)
+    if node is None:
+        node = _SMALL_NUMBERS[key] = ExprNode("num", (value,))
+    return node
+
+
+def _make(op: str, *args: ExprNode) -> ExprNode:
+    """
+    build a node, folding it to a number when every argument is a number
+    folding that raises (1/0, log(-1), ...) is left for evaluation time
+    """
+    if all(arg.op == "num" for arg in args):
+        values = [arg.args[0] for arg in args]
+        try:
+            if op in _BINARY_OPS:
+                return _num(_BINARY_OPS[op](*values))
+            if op == "neg":
+                return _num(-values[0])
+            return _num(_FUNCTIONS[op][0](float(values[0])))
+        except (ArithmeticError, ValueError, TypeError):
+            pass
+    return ExprNode(op, args)
+
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+      | (?P<op>\*\*|[-+*/^(),])
+    )""", re.VERBOSE)
+
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError(f"Unexpected character {text[pos:].strip()[:1]!r} in {text!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        tokens.append((kind, "^" if value == "**" else value))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    recursive descent parser
+        expr  := term (("+" | "-") term)*
+        term  := unary (("*" | "/") unary)*
+        unary := ("-" | "+") unary | power
+        power := atom ("^" unary)?
+        atom  := number | name "(" expr ")" | name | "(" expr ")"
+    """
+
+    def __init__(self, text: str, mode: type) -> None:
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.mode = mode
+
+    def peek(self) -> Optional[str]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos][1]
+        return None
+
+    def take(self, expected: Optional[str] = None) -> tuple[str, str]:
+        if self.pos >= len(self.tokens):
+            raise ValueError(f"Unexpected end of expression {self.text!r}")
+        token = self.tokens[self.pos]
+        if expected is not None and token[1] != expected:
+            raise ValueError(f"Expected {expected!r} but found {token[1]!r} in {self.text!r}")
+        self.pos += 1
+        return token
+
+    def parse(self) -> ExprNode:
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()!r} in {self.text!r}")
+        return node
+
+    def expr(self) -> ExprNode:
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            op = self.take()[1]
+            node = _make(op, node, self.term())
+        return node
+
+    def term(self) -> ExprNode:
+        node = self.unary()
+        while self.peek() in ("*", "/"):
+            op = self.take()[1]
+            node = _make(op, node, self.unary())
+        return node
+
+    def unary(self) -> ExprNode:
+        if self.peek() == "-":
+            self.take()
+            return _make("neg", self.unary())
+        if self.peek() == "+":
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self) -> ExprNode:
+        node = self.atom()
+        if self.peek() == "^":
+            self.take()
+            node = _make("^", node, self.unary())
+        return node
+
+    def atom(self) -> ExprNode:
+        kind, value = self.take()
+        if kind == "num":
+            return _num(_parse_number(value, self.mode))
+        if kind == "name":
+            if value in _FUNCTIONS and self.peek() == "(":
+                self.take("(")
+                node = _make(value, self.expr())
+                self.take(")")
+                return node
+            if value in _CONSTANTS:
+                return ExprNode("const", (value,))
+            return ExprNode("var", (value,))
+        if value == "(":
+            node = self.expr()
+            self.take(")")
+            return node
+        raise ValueError(f"Unexpected {value!r} in {self.text!r}")
+
+
+def _parse_number(text: str, mode: type) -> LegalNumType:
+    if mode in (Decimal, Fraction, float):
+        return mode(text)
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_expression(text: str, mode: type[LegalNumType] = float) -> ExprNode:
+    """
+    parse text into an ExprNode with constant sub-expressions folded,
+    numeric literals are read in mode
+    Example
+        >>> str(parse_expression("3*x^2 + sin(x) - 2*2"))
+        '3.0 * x ^ 2.0 + sin(x) - 4.0'
+    """
+    return _Parser(text, mode).parse()
+
+
+def _render(node: ExprNode, parent: int = 0, right: bool = False) -> str:
+    op = node.op
+    if op == "num":
+        value = node.args[0]
+        text = str(value)
+        return f"({text})" if value < 0 or "/" in text else text
+    if op in ("var", "const"):
+        return node.args[0]
+    if op in _FUNCTIONS:
+        return f"{op}({_render(node.args[0])})"
+    precedence = _PRECEDENCE[op]
+    if op == "neg":
+        text = "-" + _render(node.args[0], precedence)
+    else:
+        left, rhs = node.args
+        # ^ is right associative, the others left associative
+        text = (
+            f"{_render(left, precedence, op == '^')} {op} "
+            f"{_render(rhs, precedence, op != '^')}"
+        )
+    if precedence < parent or (precedence == parent and right):
+        return f"({text})"
+    return text
+
+
+def _literal(value: LegalNumType) -> str:
+    """
+    python source of a number as a float, through np for infinities and nan
+    """
+    try:
+        value = float(value)
+    except OverflowError:
+        value = math.inf if value > 0 else -math.inf
+    if math.isnan(value):
+        return "np.nan"
+    if math.isinf(value):
+        return "np.inf" if value > 0 else "(-np.inf)"
+    return repr(value)
+
+
+def _source(node: ExprNode, names: dict) -> str:
+    """
+    python source evaluating node with numpy, variables renamed through names,
+    sub-expressions found in names are referred to by their temporary
+    """
+    if node in names:
+        return names[node]
+    op = node.op
+    if op == "num":
+        return _literal(node.args[0])
+    if op == "const":
+        return _literal(_CONSTANTS[node.args[0]])
+    if op == "var":
+        return names[node.args[0]]
+    if op == "neg":
+        return f"(-{_source(node.args[0], names)})"
+    if op in _FUNCTIONS:
+        return f"{_FUNCTIONS[op][1]}({_source(node.args[0], names)})"
+    left, right = (_source(arg, names) for arg in node.args)
+    return f"({left} {'**' if op == '^' else op} {right})"
+
+
+def _shared_subexpressions(nodes: Sequence[ExprNode]) -> list[ExprNode]:
+    """
+    non-leaf sub-expressions used more than once across nodes, children before parents
+    """
+    counts: dict[ExprNode, int] = {}
+    order: list[ExprNode] = []
+
+    def visit(node: ExprNode) -> None:
+        if node.is_leaf:
+            return
+        counts[node] = counts.get(node, 0) + 1
+        if counts[node] > 1:
+            return
+        for arg in node.args:
+            visit(arg)
+        order.append(node)
+
+    for node in nodes:
+        visit(node)
+    return [node for node in order if counts[node] > 1]
+
+
+def compile_expressions(
+    nodes: Sequence[ExprNode],
+    variables: Optional[Sequence[str]] = None
+) -> typing.Callable:
+    """
+    compile nodes into one numpy vectorized function taking the variables positionally,
+    in sorted order unless variables is given, and returning a tuple of their values
+    sub-expressions shared between or within the nodes are computed only once
+    Example
+        >>> f = compile_expressions([parse_expression("sin(x)^2"), parse_expression("2*sin(x)")])
+        >>> f(np.array([0.]))
+        (array([0.]), array([0.]))
+    """
+    used = frozenset().union(*(node.variables for node in nodes))
+    if variables is None:
+        variables = sorted(used)
+    missing = used.difference(variables)
+    if missing:
+        raise ValueError(f"Variables {sorted(missing)} are not arguments")
+    names: dict = {name: f"_v{n}" for n, name in enumerate(variables)}
+    lines = [f"def _compiled({', '.join(names.values())}):"]
+    for n, shared in enumerate(_shared_subexpressions(nodes)):
+        lines.append(f"    _t{n} = {_source(shared, names)}")
+        names[shared] = f"_t{n}"
+    lines.append(f"    return ({''.join(_source(node, names) + ', ' for node in nodes)})")
+    namespace = {"np": np}
+    exec("\n".join(lines), namespace)
+    return namespace["_compiled"]
+
+
+def compile_expression(node: ExprNode, variables: Optional[Sequence[str]] = None) -> typing.Callable:
+    """
+    compile node into a numpy vectorized function taking the variables positionally,
+    in sorted order unless variables is given
+    Example
+        >>> f = compile_expression(parse_expression("x^2 + y"))
+        >>> f(np.array([1., 2.]), 1.)
+        array([2., 5.])
+    """
+    compiled = compile_expressions([node], variables)
+    return lambda *args: compiled(*args)[0]
+
+
+def _is_num(node: ExprNode, value: Optional[LegalNumType] = None) -> bool:
+    return node.op == "num" and (value is None or node.args[0] == value)
+
+
+def _is_integral(node: ExprNode) -> bool:
+    if not _is_num(node):
+        return False
+    try:
+        return node.args[0] == int(node.args[0])
+    except (OverflowError, ValueError):
+        return False
+
+
+def _build(op: str, *args: ExprNode) -> ExprNode:
+    """
+    _make with algebraic identities applied, used by simplify and differentiate
+    """
+    node = _make(op, *args)
+    if node.op == "num" or node.is_leaf:
+        return node
+    if op == "neg":
+        (arg,) = args
+        return arg.args[0] if arg.op == "neg" else node
+    if op in _FUNCTIONS:
+        return node
+    left, right = args
+    if op == "+":
+        if _is_num(left, 0):
+            return right
+        if _is_num(right, 0):
+            return left
+        if right.op == "neg":
+            return _build("-", left, right.args[0])
+        if left == right:
+            return _build("*", _num(2), left)
+    elif op == "-":
+        if _is_num(right, 0):
+            return left
+        if _is_num(left, 0):
+            return _build("neg", right)
+        if left == right:
+            return _num(0)
+        if right.op == "neg":
+            return _build("+", left, right.args[0])
+    elif op == "*":
+        if _is_num(left, 0) or _is_num(right, 0):
+            return _num(0)
+        if _is_num(left, 1):
+            return right
+        if _is_num(right, 1):
+            return left
+        if _is_num(left, -1):
+            return _build("neg", right)
+        if _is_num(right, -1):
+            return _build("neg", left)
+        if _is_num(right):
+            return _build("*", right, left)
+        if _is_num(left) and right.op == "*" and _is_num(right.args[0]):
+            return _build("*", _make("*", left, right.args[0]), right.args[1])
+        if left == right:
+            return _build("^", left, _num(2))
+    elif op == "/":
+        if _is_num(left, 0):
+            return _num(0)
+        if _is_num(right, 1):
+            return left
+        if left == right:
+            return _num(1)
+    elif op == "^":
+        if _is_num(right, 0):
+            return _num(1)
+        if _is_num(right, 1):
+            return left
+        # (u^a)^b = u^(a*b) only holds for every u when b is an integer: (x^2)^0.5 is |x|
+        if left.op == "^" and _is_num(left.args[1]) and _is_integral(right):
+            return _build("^", left.args[0], _make("*", left.args[1], right))
+    return node
+
+
+def simplify(node: ExprNode) -> ExprNode:
+    """
+    fold constants and apply algebraic identities bottom up
+    Example
+        >>> str(simplify(parse_expression("0*x + 1*(y^1) - (z - z)")))
+        'y'
+        >>> str(simplify(parse_expression("(x^2)^0.5")))
+        '(x ^ 2.0) ^ 0.5'
+    """
+    if node.is_leaf:
+        return node
+    return _build(node.op, *(simplify(arg) for arg in node.args))
+
+
+def differentiate(node: ExprNode, variable: str) -> ExprNode:
+    """
+    symbolic derivative of node with respect to variable, simplified
+    Example
+        >>> str(differentiate(parse_expression("x^3 + sin(2*x)"), "x"))
+        '3.0 * x ^ 2.0 + 2.0 * cos(2.0 * x)'
+    """
+    return simplify(_differentiate(node, variable, {}))
+
+
+def _differentiate(node: ExprNode, variable: str, memo: dict[ExprNode, ExprNode]) -> ExprNode:
+    if node in memo:
+        return memo[node]
+    op, args = node.op, node.args
+    if variable not in node.variables:
+        result = _num(0)
+    elif op == "var":
+        result = _num(1)
+    else:
+        d = [_differentiate(arg, variable, memo) for arg in args]
+        if op == "neg":
+            result = _build("neg", d[0])
+        elif op in ("+", "-"):
+            result = _build(op, d[0], d[1])
+        elif op == "*":
+            result = _build("+", _build("*", d[0], args[1]), _build("*", args[0], d[1]))
+        elif op == "/":
+            u, v = args
+            result = _build("/", _build("-", _build("*", d[0], v), _build("*", u, d[1])), _build("^", v, _num(2)))
+        elif op == "^":
+            u, v = args
+            if variable not in v.variables:
+                result = _build("*", _build("*", v, _build("^", u, _build("-", v, _num(1)))), d[0])
+            else:
+                result = _build("*", node, _build(
+                    "+", _build("*", d[1], _build("log", u)), _build("/", _build("*", v, d[0]), u)
+                ))
+        else:
+            result = _build("*", _chain_rule(op, args[0], node), d[0])
+    memo[node] = result
+    return result
+
+
+def _chain_rule(op: str, u: ExprNode, node: ExprNode) -> ExprNode:
+    """
+    derivative of the function op at its argument u
+    """
+    one, two = _num(1), _num(2)
+    if op == "sin":
+        return _build("cos", u)
+    if op == "cos":
+        return _build("neg", _build("sin", u))
+    if op == "tan":
+        return _build("/", one, _build("^", _build("cos", u), two))
+    if op == "asin":
+        return _build("/", one, _build("sqrt", _build("-", one, _build("^", u, two))))
+    if op == "acos":
+        return _build("neg", _build("/", one, _build("sqrt", _build("-", one, _build("^", u, two)))))
+    if op == "atan":
+        return _build("/", one, _build("+", one, _build("^", u, two)))
+    if op == "sinh":
+        return _build("cosh", u)
+    if op == "cosh":
+        return _build("sinh", u)
+    if op == "tanh":
+        return _build("-", one, _build("^", node, two))
+    if op == "exp":
+        return node
+    if op == "log":
+        return _build("/", one, u)
+    if op == "sqrt":
+        return _build("/", one, _build("*", two, node))
+    if op == "abs":
+        return _build("/", u, node)
+    raise ValueError(f"Cannot differentiate {op!r}")
+
+
+def _evaluate_number(node: ExprNode) -> LegalNumType:
+    """
+    value of an expression without variables, exact where the arithmetic allows
+    """
+    op = node.op
+    if op == "num":
+        return node.args[0]
+    if op == "const":
+        return _CONSTANTS[node.args[0]]
+    if op == "var":
+        raise ValueError(f"Free variable {node.args[0]!r}")
+    values = [_evaluate_number(arg) for arg in node.args]
+    if op == "neg":
+        return -values[0]
+    if op in _BINARY_OPS:
+        left, right = values
+        if isinstance(left, float) != isinstance(right, float):
+            left, right = float(left), float(right)
+        elif isinstance(left, Decimal) != isinstance(right, Decimal):
+            left, right = _convert(left, Decimal), _convert(right, Decimal)
+        return _BINARY_OPS[op](left, right)
+    return _FUNCTIONS[op][0](float(values[0]))
+
+
+def _convert(value: LegalNumType, mode: type[LegalNumType]) -> LegalNumType:
+    """
+    value in mode, a Decimal is rounded under the current decimal context
+    """
+    if isinstance(value, mode):
+        return value
+    if mode is Decimal and isinstance(value, Fraction):
+        return Decimal(value.numerator) / Decimal(value.denominator)
+    if mode is Decimal and isinstance(value, float):
+        return decimal.getcontext().create_decimal_from_float(value)
+    if mode is Decimal:
+        return decimal.getcontext().create_decimal(value)
+    if mode is Fraction and isinstance(value, Decimal):
+        return Fraction(value)
+    if mode is int:
+        return int(value)
+    return mode(value)
+
+
 class BaseMathExpression:
-    _content: Union[str, LegalNumType]
+    """
+    a math expression parsed once into an immutable ExprNode tree
+    content may be a string such as "3*x^2 + sin(x) - pi", a number, or an ExprNode
+    numbers fold as the tree is built, isNum and val are computed once and cached
+    exact mode: with mode Fraction or Decimal, numbers are converted to mode once on
+    construction and arithmetic stays in mode, Decimal arithmetic runs under context
+    (the current decimal context when None)
+    """
+    _content: Union[str, LegalNumType, ExprNode]
     _mode: type[LegalNumType]
     _special_constant_mode: bool = False
+    _context: Optional[decimal.Context] = None
+    _tree: ExprNode
     isNum: bool
     val: LegalNumType
 
     def __init__(
         self, 
-        content: Union[str, LegalNumType], 
+        content: Union[str, LegalNumType, ExprNode],
         mode: type[LegalNumType] = float,
-        special_constant_mode = False
+        special_constant_mode = False,
+        context: Optional[decimal.Context] = None
     ) -> None:
         self._content = content
         self._mode = mode
         self._special_constant_mode = special_constant_mode
+        self._context = context
+        if special_constant_mode:
+            if content.lower() not in _CONSTANTS:
+                raise ValueError("Unsupported Special Index")
+            self._tree = ExprNode("const", (content.lower(),))
+        elif isinstance(content, ExprNode):
+            self._tree = content
+        elif isinstance(content, str):
+            with self._arithmetic():
+                self._tree = parse_expression(content, mode)
+        elif mode in (Fraction, Decimal):
+            with self._arithmetic():
+                self._tree = _num(_convert(content, mode))
+        else:
+            self._tree = _num(content)
+        self._val = None
+        self._compiled = None
+
+    @classmethod
+    def _from_tree(
+        cls,
+        tree: ExprNode,
+        mode: type[LegalNumType],
+        context: Optional[decimal.Context]
+    ) -> "BaseMathExpression":
+        expression = cls.__new__(cls)
+        expression._content = tree
+        expression._mode = mode
+        expression._context = context
+        expression._tree = tree
+        expression._val = None
+        expression._compiled = None
+        return expression
+
+    def _arithmetic(self) -> typing.ContextManager:
+        """
+        the decimal context of Decimal mode, a no-op otherwise
+        """
+        if self._mode is Decimal:
+            return decimal.localcontext(self._context)
+        return contextlib.nullcontext()
+
+    @property
+    def tree(self) -> ExprNode:
+        return self._tree
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        return tuple(sorted(self._tree.variables))
 
     def __float__(self) -> float:
-        if self._special_constant_mode:
-            if self._content.lower() == "e":
-                return math.e
-            elif self._content.lower() == "pi":
-                return math.pi
-            else:
-                raise ValueError("Unsupported Special Index")
-        try: 
-            return float(self._content)
-        except ValueError:
-            return 0
+        if not self.isNum:
+            return 0.
+        return float(self.val)
 
     def __str__(self) -> str:
-        return str(float(self))
+        if self.isNum:
+            try:
+                return str(float(self))
+            except (ArithmeticError, ValueError):
+                pass
+        return str(self._tree)
+
+    def __repr__(self) -> str:
+        return f"BaseMathExpression({str(self._tree)!r})"
 
     @property
     def val(self) -> LegalNumType:
-        if self._special_constant_mode:
-            return float(self)
-        if self._mode is float:
-            return float(self)
-        elif self._mode in _legalNumType:
-            return self._content
-        return 0.
+        if not self.isNum:
+            if self._mode is float:
+                return float(self)
+            elif self._mode in _legalNumType:
+                return self._content
+            return 0.
+        if self._val is None:
+            with self._arithmetic():
+                value = _evaluate_number(self._tree)
+                self._val = float(value) if self._mode is float else _convert(value, self._mode)
+        return self._val
 
     @property
     def isNum(self) -> bool:
-        if self._special_constant_mode:
-            return True
-        try: 
-            float(self._content)
-        except ValueError:
-            return False
-        return True
-
-    def __add__(self, other: "BaseMathExpression"):
-        if self.isNum:
-            if other.isNum:
-                new_content = self.val + other.val
-                return BaseMathExpression(new_content, type(new_content), False)
+        return not self._tree.variables
+
+    def compile(self) -> typing.Callable:
+        """
+        numpy vectorized function of self.variables, taken positionally, compiled once
+        """
+        if self._compiled is None:
+            self._compiled = compile_expression(self._tree, self.variables)
+        return self._compiled
+
+    def _variable(self, variable: Optional[str]) -> str:
+        if variable is not None:
+            return variable
+        if len(self.variables) != 1:
+            raise ValueError(f"Specify the variable among {self.variables}")
+        return self.variables[0]
+
+    def simplify(self) -> "BaseMathExpression":
+        with self._arithmetic():
+            return self._from_tree(simplify(self._tree), self._mode, self._context)
+
+    def diff(self, variable: Optional[str] = None) -> "BaseMathExpression":
+        """
+        symbolic derivative, variable may be omitted when there is only one
+        Example
+            >>> str(BaseMathExpression("x * exp(x)").diff())
+            'exp(x) + x * exp(x)'
+        """
+        with self._arithmetic():
+            tree = differentiate(self._tree, self._variable(variable))
+        return self._from_tree(tree, self._mode, self._context)
+
+    def compile_with_derivative(self, variable: Optional[str] = None) -> typing.Callable:
+        """
+        one numpy vectorized function of variable returning (f, f') that
+        computes their shared sub-expressions once
+        """
+        variable = self._variable(variable)
+        if self.variables not in ((), (variable,)):
+            raise ValueError(f"Other variables than {variable!r} in {self}")
+        return compile_expressions([self._tree, differentiate(self._tree, variable)], [variable])
+
+    def __call__(self, *args: npt.ArrayLike, **kwargs: npt.ArrayLike):
+        """
+        evaluate over scalars or arrays, variables given positionally in sorted order or by name
+        Example
+            >>> BaseMathExpression("3*x^2 + y")(x=np.arange(3), y=1)
+            array([ 1.,  4., 13.])
+        """
+        if kwargs:
+            args = args + tuple(kwargs[name] for name in self.variables[len(args):])
+        return self.compile()(*args)
+
+    def _wrap(self, other: Union["BaseMathExpression", str, LegalNumType]) -> ExprNode:
+        if isinstance(other, BaseMathExpression):
+            return other._tree
+        if isinstance(other, self._mode) and not isinstance(other, bool):
+            return _num(other)
+        return BaseMathExpression(other, self._mode, context=self._context)._tree
+
+    def _binary(self, op: str, left: ExprNode, right: ExprNode) -> "BaseMathExpression":
+        with self._arithmetic():
+            tree = _make(op, left, right)
+        return self._from_tree(tree, self._mode, self._context)
+
+    def __add__(self, other):
+        return self._binary("+", self._tree, self._wrap(other))
+
+    def __radd__(self, other):
+        return self._binary("+", self._wrap(other), self._tree)
+
+    def __sub__(self, other):
+        return self._binary("-", self._tree, self._wrap(other))
+
+    def __rsub__(self, other):
+        return self._binary("-", self._wrap(other), self._tree)
+
+    def __mul__(self, other):
+        return self._binary("*", self._tree, self._wrap(other))
+
+    def __rmul__(self, other):
+        return self._binary("*", self._wrap(other), self._tree)
+
+    def __truediv__(self, other):
+        return self._binary("/", self._tree, self._wrap(other))
+
+    def __rtruediv__(self, other):
+        return self._binary("/", self._wrap(other), self._tree)
+
+    def __pow__(self, other):
+        return self._binary("^", self._tree, self._wrap(other))
+
+    def __rpow__(self, other):
+        return self._binary("^", self._wrap(other), self._tree)
+
+    def __neg__(self):
+        with self._arithmetic():
+            tree = _make("neg", self._tree)
+        return self._from_tree(tree, self._mode, self._context)
+
+
+def find_root(
+    expression: Union[BaseMathExpression, str],
+    x0: float,
+    variable: Optional[str] = None,
+    tol: float = 1e-12,
+    max_iter: int = 50
+) -> float:
+    """
+    Newton's method on an expression of one variable through root_finding.find_root,
+    its derivative is derived symbolically and evaluated together with it in one fused
+    call per step
+    Example
+        >>> round(find_root("x^3 + x - 1", 1.), 12)
+        0.682327803828
+    """
+    if not isinstance(expression, BaseMathExpression):
+        expression = BaseMathExpression(expression)
+    # f and fprime are asked at the same x in turn, evaluate the pair once for both
+    f_and_prime = functools.lru_cache(maxsize=1)(expression.compile_with_derivative(variable))
+    result = root_finding.find_root(
+        lambda x: float(f_and_prime(x)[0]), x0, fprime=lambda x: float(f_and_prime(x)[1]),
+        xtol=tol, rtol=tol, max_iter=max_iter
+    )
+    if not result.converged:
+        raise ArithmeticError(
+            f"No convergence after {result.iterations} iterations, last x = {result.root}"
+        )
+    return result.root
+
+
+def benchmark_modes(n_ops: int = 20000) -> dict[str, float]:
+    """
+    throughput (operations per second) of a chain x = x * a + b of n_ops operations
+    on numeric BaseMathExpression in float, Fraction and Decimal mode
+    """
+    import time
+
+    result = {}
+    for mode in (float, Fraction, Decimal):
+        x = BaseMathExpression("1/3", mode)
+        a, b = BaseMathExpression("7/8", mode), BaseMathExpression("1/16", mode)
+        start = time.perf_counter()
+        for _ in range(n_ops // 2):
+            x = x * a + b
+        x.val
+        result[mode.__name__] = n_ops / (time.perf_counter() - start)
+    return result
+
 
 cross = Multi3D.cross
 dot = Multi3D.dot
@@ -110,6 +1080,11 @@ k = Multi3D.k
 vector = vec = Multi3D.vector
 
 test = True
+benchmark = False
+if __name__ == "__main__" and benchmark:
+    for mode_name, ops_per_second in benchmark_modes().items():
+        print(f"{mode_name:>8}: {ops_per_second:,.0f} ops/s")
+
 if __name__ == "__main__" and test:
     a = BaseMathExpression("e", float, True)
     print(a._content)
@@ -117,12 +1092,11 @@ if __name__ == "__main__" and test:
     print(a.val)
     print(Multi3D.dot([1,2,3], [4,5,6]))
 
-
-
-
-a = vector(-2, 3, 4)
-b = vector(4, 5, -2)
-c = vector(2, 0, 1)
-print(
-    cross(cross(a, b), c) - cross(a, cross(b, c))
-)
+    a = vector(-2, 3, 4)
+    b = vector(4, 5, -2)
+    c = vector(2, 0, 1)
+    print(
+        cross(cross(a, b), c) - cross(a, cross(b, c))
+    )
+    a, b, c = Vec3(-2, 3, 4), Vec3(4, 5, -2), Vec3(2, 0, 1)
+    print(a.cross(b).cross(c) - a.cross(b.cross(c)))
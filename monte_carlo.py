@@ -0,0 +1,81 @@
+"""
+Chunked Monte Carlo on a process pool, shared by the simulation scripts
+    - independent seeded streams per chunk from one SeedSequence
+    - a bounded number of chunks in flight, results streamed back as they complete
+"""
+import itertools
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+def chunk_seeds(
+    n_items: int,
+    chunk_size: int,
+    seed: Optional[int] = None
+) -> Iterator[tuple[int, np.random.SeedSequence]]:
+    """
+    split n_items into chunks of at most chunk_size, yield the size of every chunk
+    with its own independent child of SeedSequence(seed), spawned one at a time
+    Example
+        >>> [size for size, _ in chunk_seeds(10, 4, seed=0)]
+        [4, 4, 2]
+    """
+    root = np.random.SeedSequence(seed)
+    for start in range(0, n_items, chunk_size):
+        yield min(chunk_size, n_items - start), root.spawn(1)[0]
+
+
+def imap_chunks(
+    func: Callable[..., Any],
+    chunk_args: Iterable[tuple],
+    processes: Optional[int] = None
+) -> Iterator[Any]:
+    """
+    yield func(*args) for every args of chunk_args in completion order
+    processes: pool size, None for one process per CPU, 0 runs everything in the current process
+    at most 2 * processes chunks are submitted ahead and every result is released once
+    yielded, so memory does not grow with the number of chunks
+    func must be picklable (defined at module level) to run on the pool
+    Example
+        >>> sorted(imap_chunks(pow, [(2, 3), (3, 2)], processes=0))
+        [8, 9]
+    """
+    if processes == 0:
+        for args in chunk_args:
+            yield func(*args)
+        return
+
+    workers = processes or os.cpu_count() or 1
+    chunk_args = iter(chunk_args)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        while True:
+            for args in itertools.islice(chunk_args, 2 * workers - len(pending)):
+                pending.add(pool.submit(func, *args))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def histogram_quantile(histogram: np.ndarray, bin_edges: np.ndarray, q: npt.ArrayLike) -> np.ndarray:
+    """
+    quantiles q of every row of histogram, counts over bin_edges,
+    resolved to the middle of the bin they fall in, shape (len(q), rows)
+    Example
+        >>> histogram_quantile(np.array([[1, 1, 2]]), np.array([0., 1., 2., 3.]), [0.25, 0.75])
+        array([[0.5],
+               [2.5]])
+    """
+    q = np.atleast_1d(np.asarray(q, dtype=float))
+    cdf = np.cumsum(histogram, axis=1)
+    index = np.stack([
+        (cdf < level * cdf[:, -1:]).sum(axis=1) for level in q
+    ])
+    upper = bin_edges[np.minimum(index + 1, len(bin_edges) - 1)]
+    return (bin_edges[index] + upper) / 2
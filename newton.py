@@ -0,0 +1,76 @@
+"""
+Newton's method on whole arrays of starting points, e.g. for basins of attraction
+"""
+from typing import Callable, Union
+import numpy as np
+import numpy.typing as npt
+from algebra import BaseMathExpression
+
+
+def newton_array(
+    g: Union[BaseMathExpression, str, Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]]],
+    starting_points: npt.ArrayLike,
+    tol: float = 1e-12,
+    n_max: int = 50,
+    decimals: int = 8
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Newton's method on every starting point at once, real or complex
+    g is an expression of one variable (its derivative is derived symbolically)
+    or a vectorized function returning (g(x), g'(x))
+    converged points are frozen, only the remaining ones are iterated
+    return
+        - x: final iterates, shaped like starting_points
+        - iterations: steps taken by each point
+        - root_index: index into roots of the root each point reached, -1 if it did not converge
+        - roots: distinct roots reached, told apart after rounding to decimals
+    Example
+        >>> x, iterations, root_index, roots = newton_array("x^2 - 1", [-3., 0.5, 2.])
+        >>> roots, root_index
+        (array([-1.,  1.]), array([0, 1, 1]))
+        >>> newton_array("x^2", [0.])[2]
+        array([0])
+    """
+    if not callable(g) or isinstance(g, BaseMathExpression):
+        if not isinstance(g, BaseMathExpression):
+            g = BaseMathExpression(g)
+        g = g.compile_with_derivative()
+    starting_points = np.asarray(starting_points)
+    dtype = np.complex128 if np.iscomplexobj(starting_points) else np.float64
+    x = starting_points.astype(dtype).ravel()
+    iterations = np.full(x.shape, n_max, dtype=np.int64)
+    converged = np.zeros(x.shape, dtype=bool)
+    # working copies of the points still iterating and their positions in x
+    index = np.arange(x.size)
+    x_active = x.copy()
+
+    with np.errstate(all="ignore"):
+        for n in range(1, n_max + 1):
+            if index.size == 0:
+                break
+            g_x, g_prime_x = g(x_active)
+            step = g_x / g_prime_x
+            # a point already on a root has converged, even where g' = 0
+            step[g_x == 0] = 0
+            # a step that is not finite (g' = 0) freezes the point as not converged
+            failed = ~np.isfinite(step)
+            step[failed] = 0
+            x_active -= step
+            scale = np.abs(x_active)
+            np.maximum(scale, 1., out=scale)
+            done = (np.abs(step) <= tol * scale) & ~failed
+            stop = done | failed
+            if stop.any():
+                finished = index[stop]
+                x[finished] = x_active[stop]
+                iterations[finished] = n
+                converged[index[done]] = True
+                keep = ~stop
+                index, x_active = index[keep], x_active[keep]
+    x[index] = x_active
+
+    root_index = np.full(x.shape, -1, dtype=np.int64)
+    # + 0. turns negative zeros into zeros before grouping
+    roots, root_index[converged] = np.unique(np.round(x[converged], decimals) + 0., return_inverse=True)
+    shape = starting_points.shape
+    return x.reshape(shape), iterations.reshape(shape), root_index.reshape(shape), roots
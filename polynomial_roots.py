@@ -0,0 +1,115 @@
+"""
+All complex roots of many polynomials at once
+Coefficients are rows of a (n_polys, degree+1) matrix, highest power first as in np.roots,
+e.g. [1, 0, 1, -1] for x**3 + x - 1
+"""
+from typing import Literal
+import numpy as np
+import numpy.typing as npt
+
+
+def horner(coefficients: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    values and derivatives of each polynomial row at the points z of shape (n_polys, m)
+    """
+    p = np.broadcast_to(coefficients[:, :1], z.shape).astype(np.complex128)
+    dp = np.zeros_like(p)
+    for n in range(1, coefficients.shape[1]):
+        dp = dp * z + p
+        p = p * z + coefficients[:, n:n + 1]
+    return p, dp
+
+
+def _companion_roots(coefficients: np.ndarray) -> np.ndarray:
+    n_polys, degree = coefficients.shape[0], coefficients.shape[1] - 1
+    companion = np.zeros((n_polys, degree, degree), dtype=coefficients.dtype)
+    companion[:, 0, :] = -coefficients[:, 1:] / coefficients[:, :1]
+    companion[:, np.arange(1, degree), np.arange(degree - 1)] = 1
+    return np.linalg.eigvals(companion)
+
+
+def _aberth_roots(coefficients: np.ndarray, tol: float, max_iter: int) -> np.ndarray:
+    n_polys, degree = coefficients.shape[0], coefficients.shape[1] - 1
+    # start on a circle of radius max |a_k / a_0| ** (1 / k), rotated off the axes
+    ratio = np.abs(coefficients[:, 1:] / coefficients[:, :1])
+    radius = (ratio ** (1 / np.arange(1, degree + 1))).max(axis=1, initial=0.)
+    radius = np.where(radius > 0, radius, 1.)
+    angle = 2 * np.pi * np.arange(degree) / degree + 0.4
+    z = radius[:, None] * np.exp(1j * angle)
+
+    active = np.arange(n_polys)
+    with np.errstate(all="ignore"):
+        for _ in range(max_iter):
+            if active.size == 0:
+                break
+            z_active = z[active]
+            p, dp = horner(coefficients[active], z_active)
+            ratio = p / dp
+            difference = z_active[:, :, None] - z_active[:, None, :]
+            difference[:, np.arange(degree), np.arange(degree)] = np.inf
+            repulsion = (1 / difference).sum(axis=2)
+            step = ratio / (1 - ratio * repulsion)
+            step = np.where(np.isfinite(step), step, 0)
+            z[active] = z_active - step
+            done = (np.abs(step) <= tol * np.maximum(1., np.abs(z[active]))).all(axis=1)
+            active = active[~done]
+    return z
+
+
+def polynomial_roots(
+    coefficients: npt.ArrayLike,
+    method: Literal["companion", "aberth"] = "companion",
+    polish: int = 0,
+    tol: float = 1e-14,
+    max_iter: int = 200
+) -> np.ndarray:
+    """
+    every complex root of every polynomial row, shape (n_polys, degree)
+    method:
+        - companion: eigenvalues of the batched companion matrices
+        - aberth: simultaneous Aberth-Ehrlich iterations on all roots of all rows
+    polish: Newton steps applied to every root afterwards
+    rows are ordered by real then imaginary part
+    Example
+        >>> polynomial_roots([[1, 0, 1, -1], [1, 0, -1, 0]], method="aberth").round(6)
+        array([[-0.341164-1.161541j, -0.341164+1.161541j,  0.682328+0.j      ],
+               [-1.      +0.j      ,  0.      +0.j      ,  1.      +0.j      ]])
+    """
+    coefficients = np.atleast_2d(np.asarray(coefficients))
+    if coefficients.ndim != 2:
+        raise ValueError("coefficients must have shape (n_polys, degree+1)")
+    coefficients = coefficients.astype(np.complex128 if np.iscomplexobj(coefficients) else np.float64)
+    if np.any(coefficients[:, 0] == 0):
+        raise ValueError("leading coefficients must be non-zero")
+    n_polys, degree = coefficients.shape[0], coefficients.shape[1] - 1
+    if degree < 1:
+        return np.empty((n_polys, 0), dtype=np.complex128)
+
+    if method == "companion":
+        roots = _companion_roots(coefficients).astype(np.complex128)
+    elif method == "aberth":
+        roots = _aberth_roots(coefficients, tol, max_iter)
+    else:
+        raise ValueError(f"Unsupported method {method!r}")
+
+    with np.errstate(all="ignore"):
+        for _ in range(polish):
+            p, dp = horner(coefficients, roots)
+            step = p / dp
+            roots = np.where(np.isfinite(step), roots - step, roots)
+    return np.sort_complex(roots + 0.)
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    coefficients = rng.normal(size=(100000, 6))
+    for method in ("companion", "aberth"):
+        start = time.perf_counter()
+        roots = polynomial_roots(coefficients, method=method, polish=1)
+        elapsed = time.perf_counter() - start
+        # |p(root)| relative to sum |a_k| |root|^k
+        scale = horner(np.abs(coefficients), np.abs(roots))[0].real
+        residual = (np.abs(horner(coefficients, roots)[0]) / scale).max()
+        print(f"{method}: {elapsed:.2f}s, max relative |p(root)| = {residual:.1e}")
@@ -0,0 +1,252 @@
+"""
+Reusable scalar root finding around Newton's method
+    - Newton with absolute and relative step tolerances and early exit
+    - secant or complex-step derivatives when no derivative is given
+    - Brent's bracketing method as a fallback once Newton diverges or leaves the bracket
+Every result counts the function (and derivative) evaluations spent.
+"""
+import math
+from typing import Callable, Literal, Optional
+
+_EPS = 2.220446049250313e-16
+
+
+class RootResult:
+    """
+    Instance Attributes:
+        - root: the approximated zero
+        - converged: whether the tolerances were met
+        - iterations: steps taken over all methods
+        - function_calls: evaluations of f
+        - derivative_calls: evaluations of fprime
+        - method: "newton", "brent", or "newton+brent" after a fallback
+    """
+    root: float
+    converged: bool
+    iterations: int
+    function_calls: int
+    derivative_calls: int
+    method: str
+
+    def __init__(
+        self,
+        root: float,
+        converged: bool,
+        iterations: int,
+        function_calls: int,
+        derivative_calls: int,
+        method: str
+    ) -> None:
+        self.root = root
+        self.converged = converged
+        self.iterations = iterations
+        self.function_calls = function_calls
+        self.derivative_calls = derivative_calls
+        self.method = method
+
+    def __repr__(self) -> str:
+        return (
+            f"RootResult(root={self.root!r}, converged={self.converged}, "
+            f"iterations={self.iterations}, function_calls={self.function_calls}, "
+            f"derivative_calls={self.derivative_calls}, method={self.method!r})"
+        )
+
+
+class _Counted:
+    """
+    wrap a callable and count its calls
+    """
+
+    def __init__(self, func: Callable) -> None:
+        self.func = func
+        self.calls = 0
+
+    def __call__(self, x):
+        self.calls += 1
+        return self.func(x)
+
+
+def _close(step: float, x: float, xtol: float, rtol: float) -> bool:
+    return abs(step) <= xtol + rtol * abs(x)
+
+
+def brent(
+    f: Callable[[float], float],
+    a: float,
+    b: float,
+    xtol: float = 1e-12,
+    rtol: float = 4 * _EPS,
+    max_iter: int = 100
+) -> RootResult:
+    """
+    Brent's method on a bracket [a, b] where f(a) and f(b) differ in sign
+    Example
+        >>> result = brent(lambda x: x**3 + x - 1, 0, 1)
+        >>> round(result.root, 12), result.converged
+        (0.682327803828, True)
+    """
+    f = _Counted(f)
+    fa, fb = f(a), f(b)
+    return _brent(f, a, b, fa, fb, xtol, rtol, max_iter, 0, "brent")
+
+
+def _brent(
+    f: _Counted,
+    a: float,
+    b: float,
+    fa: float,
+    fb: float,
+    xtol: float,
+    rtol: float,
+    max_iter: int,
+    iterations: int,
+    method: str,
+    derivative_calls: int = 0
+) -> RootResult:
+    if fa == 0:
+        return RootResult(a, True, iterations, f.calls, derivative_calls, method)
+    if (fa > 0) == (fb > 0):
+        raise ValueError(f"f({a}) and f({b}) must differ in sign")
+    # b is the best estimate, c the contrapoint keeping the root bracketed, a the previous b
+    c, fc = a, fa
+    d = e = b - a
+    for _ in range(max_iter):
+        if (fb > 0) == (fc > 0):
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tol = 2 * rtol * abs(b) + xtol / 2
+        m = (c - b) / 2
+        if abs(m) <= tol or fb == 0:
+            return RootResult(b, True, iterations, f.calls, derivative_calls, method)
+        iterations += 1
+        if abs(e) >= tol and abs(fa) > abs(fb):
+            s = fb / fa
+            if a == c:
+                # secant step
+                p, q = 2 * m * s, 1 - s
+            else:
+                # inverse quadratic interpolation
+                q, r = fa / fc, fb / fc
+                p = s * (2 * m * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            else:
+                p = -p
+            if 2 * p < min(3 * m * q - abs(tol * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = m
+        else:
+            d = e = m
+        a, fa = b, fb
+        b += d if abs(d) > tol else math.copysign(tol, m)
+        fb = f(b)
+    return RootResult(b, False, iterations, f.calls, derivative_calls, method)
+
+
+def find_root(
+    f: Callable[[float], float],
+    x0: Optional[float] = None,
+    fprime: Optional[Callable[[float], float]] = None,
+    bracket: Optional[tuple[float, float]] = None,
+    derivative: Literal["secant", "complex"] = "secant",
+    xtol: float = 1e-12,
+    rtol: float = 4 * _EPS,
+    ftol: float = 0.,
+    max_iter: int = 100
+) -> RootResult:
+    """
+    Newton's method from x0, stopping early once a step is within xtol + rtol * |x|
+    or |f(x)| <= ftol
+    without fprime the derivative comes from
+        - secant: slopes between successive iterates, no extra evaluation per step
+        - complex: f(x + ih) / h for a tiny h, f must accept complex input
+          and gives f(x) and f'(x) in one evaluation
+    with a bracket [a, b] where f changes sign, Newton steps are kept inside it and
+    Brent's method takes over when a step leaves it, stalls or f' vanishes;
+    x0 defaults to the middle of the bracket, also when it lies outside
+    Example
+        >>> result = find_root(lambda x: x**3 + x - 1, 1., fprime=lambda x: 3*x**2 + 1)
+        >>> round(result.root, 12), result.function_calls
+        (0.682327803828, 6)
+        >>> find_root(lambda x: math.atan(x), 5., bracket=(-1., 10.)).method
+        'newton+brent'
+    """
+    if x0 is None and bracket is None:
+        raise ValueError("Either x0 or bracket is required")
+    if bracket is not None and (x0 is None or not min(bracket) <= x0 <= max(bracket)):
+        x0 = (bracket[0] + bracket[1]) / 2
+    f = _Counted(f)
+    fprime = _Counted(fprime) if fprime is not None else None
+
+    def evaluate(x: float) -> tuple[float, Optional[float]]:
+        if fprime is not None:
+            return f(x), fprime(x)
+        if derivative == "complex":
+            h = 1e-20 * max(1., abs(x))
+            value = f(complex(x, h))
+            return value.real, value.imag / h
+        return f(x), None
+
+    a = b = fa = fb = None
+    if bracket is not None:
+        a, b = bracket
+        fa, fb = f(a), f(b)
+        for x, fx in ((a, fa), (b, fb)):
+            if fx == 0:
+                return RootResult(x, True, 0, f.calls, 0, "newton")
+        if (fa > 0) == (fb > 0):
+            raise ValueError(f"f({a}) and f({b}) must differ in sign")
+
+    x = float(x0)
+    fx, dfx = evaluate(x)
+    x_prev = f_prev = None
+    iterations = 0
+    derivative_calls = lambda: fprime.calls if fprime is not None else 0
+    for iterations in range(1, max_iter + 1):
+        if abs(fx) <= ftol:
+            return RootResult(x, True, iterations - 1, f.calls, derivative_calls(), "newton")
+        if bracket is not None:
+            # shrink the bracket around the sign change
+            if (fx > 0) == (fa > 0):
+                a, fa = x, fx
+            else:
+                b, fb = x, fx
+        if dfx is None:
+            if x_prev is None:
+                h = math.sqrt(_EPS) * max(1., abs(x))
+                dfx = (f(x + h) - fx) / h
+            else:
+                dfx = (fx - f_prev) / (x - x_prev)
+        step = fx / dfx if dfx != 0 and math.isfinite(dfx) else math.inf
+        x_new = x - step
+        diverging = f_prev is not None and abs(fx) > 2 * abs(f_prev)
+        if bracket is not None and (
+            not math.isfinite(x_new) or diverging
+            or not min(a, b) <= x_new <= max(a, b)
+        ):
+            return _brent(
+                f, a, b, fa, fb, xtol, rtol, max_iter - iterations,
+                iterations, "newton+brent", derivative_calls()
+            )
+        if not math.isfinite(x_new):
+            return RootResult(x, False, iterations, f.calls, derivative_calls(), "newton")
+        x_prev, f_prev = x, fx
+        x = x_new
+        if _close(step, x, xtol, rtol):
+            return RootResult(x, True, iterations, f.calls, derivative_calls(), "newton")
+        fx, dfx = evaluate(x)
+    return RootResult(x, False, iterations, f.calls, derivative_calls(), "newton")
+
+
+if __name__ == "__main__":
+    g_x = lambda x: x**3 + x - 1
+    for derivative in ("secant", "complex"):
+        print(derivative, find_root(g_x, 1., derivative=derivative))
+    print("exact", find_root(g_x, 1., fprime=lambda x: 3*x**2 + 1))
+    print("bracketed", find_root(g_x, 1., bracket=(0., 1.)))
+    print("brent", brent(g_x, 0., 1.))
@@ -1,44 +1,517 @@
-import matplotlib.pyplot as plt
-from typing import Callable
-
-def interate_sequence(func: Callable, start_value: float, interations: int) -> list[float]:
-    """
-    plot a sequence given the recursive definition
-    Input:
-        - func: Callable
-        - start_value: float
-        - iterations: int
-    Example
-        >>> func = lambda x: abs(x ** 2 - 1)
-        >>> x_initial = 0.5
-        >>> iterations = 3
-        >>> interate_sequence(lambda x: abs(x ** 2 - 1), 0.5, 3)
-        [0.5, 0.75, 0.4375, 0.80859375]
-    """
-    x_prev = start_value
-    result = []
-    for i in range(interations + 1):
-        result.append(x_prev)
-        x_prev = func(x_prev)
-    return result
-
-if __name__ == "__main__":
-    import math
-
-    x_min = 0
-    x_max = 15
-    func = lambda x: 2.2 * (x - x**2)
-    initial_values = [0.4]
-
-    x1 = list(range(x_min, x_max + 1))
-    y = [interate_sequence(func, initial_value, x_max) for initial_value in initial_values]
-    for i in range(len(y[0])): 
-        print(f"iter {i}: {y[0][i]}")
-    for i in y:
-        plt.plot(i)
-    # axis labeling
-    plt.xlabel('iterations')
-    plt.ylabel('output')
-    # figure name
-    plt.title('Dot Plot : output vs iterations')
-    plt.show()
\ No newline at end of file
+import math
+from collections import OrderedDict
+import numpy as np
+import numpy.typing as npt
+from typing import Callable, Optional
+
+def interate_sequence(func: Callable, start_value: float, interations: int) -> list[float]:
+    """
+    plot a sequence given the recursive definition
+    Input:
+        - func: Callable
+        - start_value: float
+        - iterations: int
+    Example
+        >>> func = lambda x: abs(x ** 2 - 1)
+        >>> x_initial = 0.5
+        >>> iterations = 3
+        >>> interate_sequence(lambda x: abs(x ** 2 - 1), 0.5, 3)
+        [0.5, 0.75, 0.4375, 0.80859375]
+    """
+    x_prev = start_value
+    result = []
+    for i in range(interations + 1):
+        result.append(x_prev)
+        x_prev = func(x_prev)
+    return result
+
+def interate_sequence_batch(
+    func: Callable[[np.ndarray], np.ndarray],
+    start_values: npt.ArrayLike,
+    interations: int,
+    transient: int = 0,
+    keep_last: Optional[int] = None,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    advance every start value together under a vectorized map
+    Input:
+        - func: Callable, maps an array of states to the next states
+        - start_values: array of initial states, of any shape
+        - interations: int, iterations after the transient
+        - transient: int, iterations discarded first without being stored
+        - keep_last: int, only the last keep_last iterates are kept (default all)
+        - out: preallocated buffer of shape start_values.shape + (keep_last,)
+    Output:
+        buffer of the last keep_last iterates along the last axis, oldest first
+    Example
+        >>> interate_sequence_batch(lambda x: abs(x ** 2 - 1), [0.5, 0.], 3)
+        array([[0.5       , 0.75      , 0.4375    , 0.80859375],
+               [0.        , 1.        , 0.        , 1.        ]])
+    """
+    x = np.array(start_values, dtype=float)
+    for _ in range(transient):
+        x = func(x)
+    total = interations + 1
+    keep_last = total if keep_last is None else min(keep_last, total)
+    shape = x.shape + (keep_last,)
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, expected {shape}")
+    for _ in range(total - keep_last):
+        x = func(x)
+    out[..., 0] = x
+    for i in range(1, keep_last):
+        x = func(x)
+        out[..., i] = x
+    return out
+
+class OrbitAnalysis:
+    """
+    Instance Attributes:
+        - periodic: whether a cycle was found and confirmed
+        - cycle_start: index of the first iterate on the cycle
+        - cycle_length: period of the cycle, 1 for a fixed point
+        - cycle: the values of one period, starting at cycle_start
+        - evaluations: calls of func spent
+        - lyapunov: estimated Lyapunov exponent, None without a derivative
+    """
+    periodic: bool
+    cycle_start: Optional[int]
+    cycle_length: Optional[int]
+    cycle: list[float]
+    evaluations: int
+    lyapunov: Optional[float]
+
+    def __init__(
+        self,
+        periodic: bool,
+        cycle_start: Optional[int],
+        cycle_length: Optional[int],
+        cycle: list[float],
+        evaluations: int,
+        lyapunov: Optional[float]
+    ) -> None:
+        self.periodic = periodic
+        self.cycle_start = cycle_start
+        self.cycle_length = cycle_length
+        self.cycle = cycle
+        self.evaluations = evaluations
+        self.lyapunov = lyapunov
+
+    def __repr__(self) -> str:
+        return (
+            f"OrbitAnalysis(periodic={self.periodic}, cycle_start={self.cycle_start}, "
+            f"cycle_length={self.cycle_length}, cycle={self.cycle}, "
+            f"evaluations={self.evaluations}, lyapunov={self.lyapunov})"
+        )
+
+def analyse_sequence(
+    func: Callable,
+    start_value: float,
+    interations: int,
+    tol: float = 1e-9,
+    derivative: Optional[Callable] = None,
+    confirm: int = 2
+) -> OrbitAnalysis:
+    """
+    detect a cycle of the sequence with Brent's algorithm in constant memory,
+    stopping as soon as the period has repeated within tol confirm more times
+    Input:
+        - func: Callable
+        - start_value: float
+        - interations: int, most iterations to try before giving up
+        - tol: float, iterates closer than tol count as equal
+        - derivative: Callable, func' to estimate the Lyapunov exponent, averaged over
+          the cycle when one is found, otherwise over every iterate computed
+        - confirm: int, extra periods that must repeat before the cycle is accepted
+    Example
+        >>> orbit = analyse_sequence(lambda x: abs(x ** 2 - 1), 0.5, 1000)
+        >>> orbit.cycle_length, [round(x, 6) for x in orbit.cycle]
+        (2, [1.0, 0.0])
+        >>> round(analyse_sequence(lambda x: 3.2 * x * (1 - x), 0.4, 1000,
+        ...     derivative=lambda x: 3.2 * (1 - 2 * x)).lyapunov, 4)
+        -0.9163
+    """
+    evaluations = 0
+    log_derivative = 0.
+
+    def step(x: float) -> float:
+        nonlocal evaluations, log_derivative
+        evaluations += 1
+        if derivative is not None:
+            log_derivative += math.log(abs(derivative(x)) or 1e-300)
+        return func(x)
+
+    def give_up() -> OrbitAnalysis:
+        lyapunov = log_derivative / evaluations if derivative is not None else None
+        return OrbitAnalysis(False, None, None, [], evaluations, lyapunov)
+
+    close = lambda a, b: abs(a - b) <= tol
+    # phase 1: the hare runs ahead, the tortoise teleports to it at powers of two
+    tortoise, hare = start_value, step(start_value)
+    power = cycle_length = 1
+    while True:
+        while not close(tortoise, hare):
+            if evaluations >= interations:
+                return give_up()
+            if power == cycle_length:
+                tortoise = hare
+                power *= 2
+                cycle_length = 0
+            hare = step(hare)
+            cycle_length += 1
+        # confirm the period repeats before trusting it
+        repeated = 0
+        for _ in range(confirm):
+            reference = hare
+            for _ in range(cycle_length):
+                if evaluations >= interations:
+                    return give_up()
+                hare = step(hare)
+            if not close(reference, hare):
+                break
+            repeated += 1
+        if repeated == confirm:
+            break
+        # a false alarm: restart phase 1 from where the hare is
+        tortoise, hare = hare, step(hare)
+        power = cycle_length = 1
+
+    # phase 2: find where the cycle starts, the hare leads by one period
+    tortoise = hare = start_value
+    for _ in range(cycle_length):
+        hare = func(hare)
+    cycle_start = 0
+    while not close(tortoise, hare):
+        tortoise, hare = func(tortoise), func(hare)
+        cycle_start += 1
+    evaluations += cycle_length + 2 * cycle_start
+
+    cycle = [tortoise]
+    for _ in range(cycle_length - 1):
+        cycle.append(func(cycle[-1]))
+    evaluations += cycle_length - 1
+    lyapunov = None
+    if derivative is not None:
+        lyapunov = sum(math.log(abs(derivative(x)) or 1e-300) for x in cycle) / cycle_length
+    return OrbitAnalysis(True, cycle_start, cycle_length, cycle, evaluations, lyapunov)
+
+def logistic_map(x: np.ndarray, r: npt.ArrayLike) -> np.ndarray:
+    return r * x * (1 - x)
+
+def bifurcation_diagram(
+    r_values: npt.ArrayLike,
+    start_value: float = 0.5,
+    transient: int = 1000,
+    keep_last: int = 100,
+    func: Callable[[np.ndarray, np.ndarray], np.ndarray] = logistic_map
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    orbits of func(x, r) for every r at once, e.g. of the logistic map
+    Output:
+        r and x of shape (len(r_values), keep_last), ready to scatter
+    Example
+        >>> r, x = bifurcation_diagram([2.5, 3.2], keep_last=2)
+        >>> x.round(4)
+        array([[0.6   , 0.6   ],
+               [0.513 , 0.7995]])
+    """
+    r = np.asarray(r_values, dtype=float)
+    x = interate_sequence_batch(
+        lambda x: func(x, r), np.full(r.shape, start_value),
+        keep_last - 1, transient=transient, keep_last=keep_last
+    )
+    return np.broadcast_to(r[:, None], x.shape), x
+
+def lttb(x: npt.ArrayLike, y: npt.ArrayLike, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    largest-triangle-three-buckets decimation of a series to n_out points,
+    keeping its visual shape, first and last points are always kept
+    Example
+        >>> x, y = lttb(range(1000), [i % 100 for i in range(1000)], 50)
+        >>> len(x), float(x[0]), float(x[-1])
+        (50, 0.0, 999.0)
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        # average of the next bucket, the last point for the last bucket
+        if b + 2 < len(edges):
+            next_x, next_y = x[stop:edges[b + 2]].mean(), y[stop:edges[b + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        keep[b + 1] = previous
+    return x[keep], y[keep]
+
+class OrbitDensity:
+    """
+    fixed-size 2d histogram that orbits are streamed into, so the cost of
+    drawing stays bounded by its width * height whatever the number of points
+    Instance Attributes:
+        - counts: array of shape (height, width), row 0 at y_range[0]
+    """
+    counts: np.ndarray
+
+    def __init__(
+        self,
+        x_range: tuple[float, float],
+        y_range: tuple[float, float],
+        width: int = 1000,
+        height: int = 800
+    ) -> None:
+        self.x_range = x_range
+        self.y_range = y_range
+        self.counts = np.zeros((height, width), dtype=np.int64)
+
+    def add(self, x: npt.ArrayLike, y: npt.ArrayLike) -> None:
+        """
+        count points (x, y), broadcast against each other, outside points are dropped
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        height, width = self.counts.shape
+        column = (x.ravel() - self.x_range[0]) / (self.x_range[1] - self.x_range[0]) * width
+        row = (y.ravel() - self.y_range[0]) / (self.y_range[1] - self.y_range[0]) * height
+        inside = (column >= 0) & (column < width) & (row >= 0) & (row < height)
+        flat = row[inside].astype(np.int64) * width + column[inside].astype(np.int64)
+        self.counts += np.bincount(flat, minlength=width * height).reshape(height, width)
+
+    def add_orbits(self, orbits: np.ndarray, first_iteration: int = 0) -> None:
+        """
+        add orbits of shape (n_orbits, n_iterations) against their iteration index
+        """
+        iterations = np.arange(first_iteration, first_iteration + orbits.shape[-1])
+        self.add(iterations, orbits)
+
+    def image(self, log: bool = True) -> np.ndarray:
+        """
+        counts scaled to [0, 1] with the y axis pointing up
+        """
+        image = np.log1p(self.counts) if log else self.counts.astype(float)
+        peak = image.max()
+        return (image / peak if peak > 0 else image)[::-1]
+
+    def save(self, path: str, log: bool = True, cmap: str = "magma") -> None:
+        """
+        write the density as a PNG, headless
+        """
+        from matplotlib import image
+
+        image.imsave(path, self.image(log), cmap=cmap)
+
+def render_bifurcation(
+    path: str,
+    r_range: tuple[float, float] = (2.5, 4.),
+    y_range: tuple[float, float] = (0., 1.),
+    width: int = 1000,
+    height: int = 800,
+    orbits_per_column: int = 10,
+    transient: int = 1000,
+    keep_last: int = 1000,
+    chunk: int = 1000,
+    func: Callable[[np.ndarray, np.ndarray], np.ndarray] = logistic_map
+) -> OrbitDensity:
+    """
+    stream the bifurcation diagram of func(x, r) into an OrbitDensity chunk by chunk
+    and save it to path, memory stays bounded by chunk * keep_last
+    y_range: span of x values drawn, (0, 1) fits the logistic map
+    """
+    r_values = np.linspace(*r_range, width * orbits_per_column, endpoint=False)
+    density = OrbitDensity(r_range, y_range, width, height)
+    for start in range(0, len(r_values), chunk):
+        r, x = bifurcation_diagram(
+            r_values[start:start + chunk], transient=transient, keep_last=keep_last, func=func
+        )
+        density.add(r, x)
+    density.save(path)
+    return density
+
+def plot_sequences(
+    sequences: list[npt.ArrayLike],
+    path: Optional[str] = None,
+    max_points: int = 2000
+) -> None:
+    """
+    plot sequences against their iterations, each decimated with lttb to max_points,
+    written headless to path when given, shown otherwise
+    """
+    if path is None:
+        import matplotlib.pyplot as plt
+
+        figure = plt.figure()
+    else:
+        from matplotlib.figure import Figure
+
+        figure = Figure()
+    axes = figure.add_subplot()
+    for sequence in sequences:
+        axes.plot(*lttb(np.arange(len(sequence)), sequence, max_points))
+    # axis labeling
+    axes.set_xlabel('iterations')
+    axes.set_ylabel('output')
+    # figure name
+    axes.set_title('Dot Plot : output vs iterations')
+    if path is None:
+        plt.show()
+    else:
+        figure.savefig(path)
+
+def collatz(n):
+    """
+    the Collatz map, on an int or elementwise on an integer array
+    """
+    if isinstance(n, np.ndarray):
+        odd = (n & 1).astype(bool)
+        return np.where(odd, 3 * n + 1, n >> 1)
+    return n // 2 if n % 2 == 0 else 3 * n + 1
+
+class OrbitCache:
+    """
+    memoized stopping times of an integer map, shared across starting values
+    the stopping time of n is the number of steps its orbit takes to reach terminal;
+    once known for every value along an orbit, any later orbit joining it stops there
+    values below dense_limit live in an array (grown by sweep), larger ones in a
+    bounded LRU dict
+    Instance Attributes:
+        - hits: lookups answered by the cache
+        - misses: map evaluations spent
+    Example
+        >>> cache = OrbitCache(collatz)
+        >>> cache.stopping_time(27), cache.stopping_time(54)
+        (111, 112)
+        >>> cache.hits, cache.misses
+        (2, 112)
+    """
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        func: Callable = collatz,
+        terminal: tuple[int, ...] = (1,),
+        dense_limit: int = 1 << 20,
+        lru_size: int = 1 << 16,
+        max_steps: int = 1 << 20,
+        dtype: npt.DTypeLike = np.int32
+    ) -> None:
+        self.func = func
+        self.terminal = frozenset(terminal)
+        self.max_steps = max_steps
+        self.lru_size = lru_size
+        self.hits = self.misses = 0
+        # -1 marks unknown
+        self._dense = np.full(dense_limit, -1, dtype=dtype)
+        self._sparse: OrderedDict[int, int] = OrderedDict()
+        for t in self.terminal:
+            self._store(t, 0)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "dense_size": len(self._dense),
+            "sparse_size": len(self._sparse),
+        }
+
+    def _lookup(self, n: int) -> Optional[int]:
+        if 0 <= n < len(self._dense):
+            value = int(self._dense[n])
+            return None if value < 0 else value
+        value = self._sparse.get(n)
+        if value is not None:
+            self._sparse.move_to_end(n)
+        return value
+
+    def _store(self, n: int, steps: int) -> None:
+        if 0 <= n < len(self._dense):
+            self._dense[n] = steps
+            return
+        self._sparse[n] = steps
+        if len(self._sparse) > self.lru_size:
+            self._sparse.popitem(last=False)
+
+    def stopping_time(self, n: int) -> int:
+        path = []
+        known = self._lookup(n)
+        while known is None:
+            if len(path) >= self.max_steps:
+                raise RuntimeError(f"orbit of {path[0]} did not reach {set(self.terminal)} in {self.max_steps} steps")
+            path.append(n)
+            n = self.func(n)
+            self.misses += 1
+            known = self._lookup(n)
+        self.hits += 1
+        for steps, value in enumerate(reversed(path), known + 1):
+            self._store(value, steps)
+        return known + len(path)
+
+    def sweep(self, up_to: int, chunk: int = 1 << 16) -> np.ndarray:
+        """
+        stopping times of every start value in [0, up_to), computed chunk by chunk
+        with a vectorized func, every orbit stops as soon as it reaches a value whose
+        stopping time is already known, 0 has no stopping time and is -1
+        Example
+            >>> OrbitCache().sweep(10)
+            array([-1,  0,  1,  7,  2,  5,  8, 16,  3, 19], dtype=int32)
+        """
+        if up_to > len(self._dense):
+            grown = np.full(up_to, -1, dtype=self._dense.dtype)
+            grown[:len(self._dense)] = self._dense
+            self._dense = grown
+        dense = self._dense
+        # terminal values inside the table are already known with stopping time 0
+        terminal = np.array(sorted(t for t in self.terminal if t >= up_to), dtype=np.int64)
+        for lo in range(1, up_to, chunk):
+            hi = min(lo + chunk, up_to)
+            start = np.arange(lo, hi, dtype=np.int64)
+            unknown = dense[lo:hi] < 0
+            start, current = start[unknown], start[unknown]
+            steps = np.zeros(len(start), dtype=np.int64)
+            for _ in range(self.max_steps):
+                if len(start) == 0:
+                    break
+                current = self.func(current)
+                self.misses += len(current)
+                steps += 1
+                # join any orbit already known, earlier chunks or finished starts of this one
+                known = dense.take(current, mode="clip")
+                known[current >= up_to] = -1
+                done = known >= 0
+                if len(terminal):
+                    done |= np.isin(current, terminal)
+                if done.any():
+                    self.hits += int(np.count_nonzero(known >= 0))
+                    dense[start[done]] = steps[done] + np.maximum(known[done], 0)
+                    keep = ~done
+                    start, current, steps = start[keep], current[keep], steps[keep]
+            # orbits finishing on the last allowed step leave nothing behind
+            if len(start):
+                raise RuntimeError(f"orbits in [{lo}, {hi}) did not settle in {self.max_steps} steps")
+        return dense[:up_to]
+
+if __name__ == "__main__":
+
+    x_min = 0
+    x_max = 15
+    func = lambda x: 2.2 * (x - x**2)
+    initial_values = [0.4]
+
+    x1 = list(range(x_min, x_max + 1))
+    y = [interate_sequence(func, initial_value, x_max) for initial_value in initial_values]
+    for i in range(len(y[0])): 
+        print(f"iter {i}: {y[0][i]}")
+    plot_sequences(y)
@@ -1,9 +1,15 @@
+import decimal
 import itertools as it
-import statistics
-from typing import TypeVar
-import matplotlib.pyplot as plt
+import math
+from fractions import Fraction
+from typing import Callable, Iterator, Optional, TypeVar, Union
+import numpy as np
+import numpy.typing as npt
+from monte_carlo import chunk_seeds, histogram_quantile, imap_chunks
 
 _T = TypeVar("_T")
+Number = Union[float, Fraction]
+
 def list_count(items: list[_T]) -> dict[_T, int]:
     counts = dict()
     for i in items:
@@ -32,15 +38,479 @@ def product(items: list[float]) -> float:
         cnt *= i
     return cnt
 
-value = [15, 16, 17, 18]
-prob = [0.1, 0.2, 0.3, 0.4]
+def _bin_sum(index: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    """
+    sum of weights per index in the dtype of weights; bincount only sums in float64,
+    which would round integer weights beyond 2 ** 53
+    """
+    if weights.dtype.kind == "f":
+        return np.bincount(index, weights, minlength=size).astype(weights.dtype)
+    totals = np.zeros(size, dtype=weights.dtype)
+    np.add.at(totals, index, weights)
+    return totals
+
+def _reduce(keys: np.ndarray, weights: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    distinct keys, sorted, and the sum of the weights of each
+    """
+    if keys.dtype.kind in "iu" and weights.dtype != object:
+        low, high = keys.min(), keys.max()
+        # in Python ints, the difference of int64 keys may not fit in an int64
+        if int(high) - int(low) < max(keys.size, 1 << 16):
+            # small integer range: count into bins, no sorting
+            offset = (keys - low).astype(np.intp)
+            present = np.flatnonzero(np.bincount(offset))
+            totals = _bin_sum(offset, weights, len(present) and present[-1] + 1)[present]
+            return (present + low).astype(keys.dtype), totals
+    order = np.argsort(keys, kind="stable")
+    keys, weights = keys[order], weights[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.add.reduceat(weights, starts)
+
+class GroupedSum:
+    """
+    running totals of weights grouped by key, built from NumPy arrays in any number of chunks
+    keys are grouped on their exact values and only rounded in result,
+    sums stay in the dtype of the weights (int counts, floats, or Fraction objects)
+    Instance Attributes:
+        - keys: sorted distinct keys seen so far
+        - totals: summed weights, aligned with keys
+    Example
+        >>> grouped = GroupedSum().add([1/3, 0.5, 1/3], [0.25, 0.5, 0.25])
+        >>> grouped.add([0.5], [1.]).result(3)
+        {0.333: 0.5, 0.5: 1.5}
+        >>> GroupedSum().add(["b", "a", "b"]).result()
+        {'a': 1, 'b': 2}
+    """
+    keys: np.ndarray
+    totals: np.ndarray
+
+    def __init__(self) -> None:
+        self.keys = np.empty(0)
+        self.totals = np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, keys: npt.ArrayLike, weights: Optional[npt.ArrayLike] = None) -> "GroupedSum":
+        """
+        group one more chunk of keys, each counting once when weights is None
+        """
+        keys = np.asarray(keys).ravel()
+        weights = np.ones(keys.shape, dtype=np.int64) if weights is None else np.asarray(weights).ravel()
+        if keys.shape != weights.shape:
+            raise ValueError("keys and weights must have the same size")
+        dtype = np.result_type(self.totals, weights)
+        if len(self.keys) and keys.size and dtype != object and keys.dtype.kind not in "iu":
+            # keys seen before are added in place, only new ones need sorting
+            position = np.searchsorted(self.keys, keys).clip(max=len(self.keys) - 1)
+            seen = self.keys[position] == keys
+            self.totals = self.totals.astype(dtype) + _bin_sum(
+                position[seen], weights[seen].astype(dtype), len(self.keys)
+            )
+            keys, weights = keys[~seen], weights[~seen]
+        if keys.size == 0:
+            return self
+        keys, weights = _reduce(keys, weights)
+        if len(self.keys):
+            keys, weights = _reduce(
+                np.concatenate((self.keys, keys)), np.concatenate((self.totals, weights))
+            )
+        self.keys, self.totals = keys, weights
+        return self
+
+    def merge(self, other: "GroupedSum") -> "GroupedSum":
+        return self.add(other.keys, other.totals)
+
+    def result(self, decimals: Optional[int] = None) -> dict:
+        """
+        the totals as a dict, with keys and totals rounded to decimals at this point only;
+        keys that become equal after rounding are summed
+        """
+        if decimals is None or self.keys.dtype.kind not in "fiuc":
+            grouped = self
+        else:
+            grouped = GroupedSum().add(np.round(self.keys, decimals) + 0, self.totals)
+        totals = grouped.totals
+        if decimals is not None and totals.dtype.kind in "fc":
+            totals = np.round(totals, decimals)
+        return dict(zip(grouped.keys.tolist(), totals.tolist()))
+
+def group_sum(
+    keys: npt.ArrayLike,
+    weights: Optional[npt.ArrayLike] = None,
+    decimals: Optional[int] = None
+) -> dict:
+    """
+    vectorized combine_dict / list_count: total weight (or count) of every distinct key
+    Example
+        >>> group_sum([16, 15, 16], [0.2, 0.1, 0.3])
+        {15: 0.1, 16: 0.5}
+    """
+    return GroupedSum().add(keys, weights).result(decimals)
+
+def _exact(x: Union[int, float, Fraction]) -> Fraction:
+    """
+    a float is read as the decimal it prints as, so 0.1 becomes 1/10
+    """
+    return Fraction(repr(x)) if isinstance(x, float) else Fraction(x)
+
+def _lattice(values: list[Fraction], n: int, max_size: int) -> tuple[Fraction, Fraction, list[int]]:
+    """
+    write values as low + step * index, with the sum of n of them spanning at most max_size points
+    """
+    low = min(values)
+    step = Fraction(0)
+    for v in values:
+        d = v - low
+        # gcd of fractions: gcd of numerators over lcm of denominators
+        step = Fraction(
+            math.gcd(step.numerator * d.denominator, d.numerator * step.denominator),
+            step.denominator * d.denominator
+        )
+    if step == 0:
+        return low, Fraction(1), [0] * len(values)
+    index = [int((v - low) / step) for v in values]
+    if n * max(index) + 1 > max_size:
+        raise OverflowError("support is not a small lattice")
+    return low, step, index
+
+def _power_dict(pmf: dict, n: int) -> dict:
+    """
+    distribution of the sum of n iid draws from pmf by binary exponentiation, for any support
+    """
+    def convolve(a: dict, b: dict) -> dict:
+        c = {}
+        for x, p in a.items():
+            for y, q in b.items():
+                c[x + y] = c.get(x + y, 0) + p * q
+        return c
+
+    result = {0: 1}
+    while n:
+        if n & 1:
+            result = convolve(result, pmf)
+        n >>= 1
+        if n:
+            pmf = convolve(pmf, pmf)
+    return result
+
+def _power_exact(weights: list[int], n: int) -> list[int]:
+    """
+    integer coefficients of (sum weights[i] x^i) ** n through one big-number power
+    (Kronecker substitution): the weights are packed as blocks of decimal digits, so the
+    decimal module's fast multiplication does the convolution and the coefficients are
+    sliced out of the digits of the result in one pass
+    """
+    # enough digits per block to hold the largest coefficient, sum(weights) ** n
+    digits = int(n * max(1, sum(weights)).bit_length() * math.log10(2)) + 2
+    exact = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    with decimal.localcontext(exact):
+        packed = decimal.Decimal(0)
+        for w in reversed(weights):
+            packed = packed.scaleb(digits) + w
+        packed **= n
+    size = n * (len(weights) - 1) + 1
+    text = str(packed).zfill(size * digits)
+    # int(Decimal) is not bound by the int/str conversion digit limit
+    return [
+        int(decimal.Decimal(text[len(text) - (i + 1) * digits:len(text) - i * digits]))
+        for i in range(size)
+    ]
+
+def _power_float(pmf: np.ndarray, n: int, fft_size: int = 512) -> np.ndarray:
+    size = n * (len(pmf) - 1) + 1
+    if size >= fft_size:
+        length = 1 << (size - 1).bit_length()
+        result = np.fft.irfft(np.fft.rfft(pmf, length) ** n, length)[:size]
+        return np.clip(result, 0, None)
+    result = np.ones(1)
+    while n:
+        if n & 1:
+            result = np.convolve(result, pmf)
+        n >>= 1
+        if n:
+            pmf = np.convolve(pmf, pmf)
+    return result
+
+def mean_distribution(
+    value: list[float],
+    prob: list[float],
+    n: int,
+    exact: bool = False,
+    max_lattice: int = 1 << 24,
+    max_terms: int = 1 << 10,
+    bins: int = 4096
+) -> dict[Number, Number]:
+    """
+    exact distribution of the mean of n iid draws of value with probability prob,
+    by repeated convolution of the pmf instead of enumerating len(value) ** n samples
+    values on a lattice (e.g. integers) are convolved as arrays, with one FFT power for
+    large supports, or with exact=True as Fractions through one big-int power;
+    other supports are convolved as dicts while their up to C(n + k - 1, n) distinct sums
+    of k values stay within max_terms, beyond that the values are rounded to a grid of
+    bins points and convolved as a lattice, an approximation exact=True refuses
+    Example
+        >>> mean_distribution([0, 1], [0.5, 0.5], 2)
+        {0.0: 0.25, 0.5: 0.5, 1.0: 0.25}
+        >>> mean_distribution([15, 16], [0.1, 0.9], 2, exact=True)
+        {Fraction(15, 1): Fraction(1, 100), Fraction(31, 2): Fraction(9, 50), Fraction(16, 1): Fraction(81, 100)}
+        >>> mean_distribution([i ** 0.5 for i in range(10)], [0.1] * 10, 6, exact=True)
+        Traceback (most recent call last):
+        ...
+        ValueError: values off a lattice give up to 5005 distinct sums of 6 draws, more than max_terms=1024, use exact=False to round them to a grid
+    """
+    assert len(value) == len(prob)
+    exact_values = [_exact(v) for v in value]
+    try:
+        low, step, index = _lattice(exact_values, n, max_lattice)
+    except OverflowError:
+        terms = math.comb(n + len(set(exact_values)) - 1, n)
+        if terms <= max_terms:
+            pmf = {}
+            for v, p in zip(exact_values, prob):
+                pmf[v] = pmf.get(v, 0) + (_exact(p) if exact else p)
+            sums = _power_dict(pmf, n)
+            return {
+                (s / n if exact else float(s / n)): p
+                for s, p in sorted(sums.items()) if p
+            }
+        if exact:
+            raise ValueError(
+                f"values off a lattice give up to {terms} distinct sums of {n} draws, "
+                f"more than max_terms={max_terms}, use exact=False to round them to a grid"
+            )
+        low = float(min(exact_values))
+        step = (float(max(exact_values)) - low) / (bins - 1)
+        index = [round((v - low) / step) for v in map(float, exact_values)]
+
+    size = max(index) + 1
+    if exact:
+        probabilities = [_exact(p) for p in prob]
+        denominator = math.lcm(*(p.denominator for p in probabilities))
+        weights = [0] * size
+        for i, p in zip(index, probabilities):
+            weights[i] += int(p * denominator)
+        coefficients = _power_exact(weights, n)
+        scale = Fraction(1, denominator ** n)
+        distribution = [c * scale for c in coefficients]
+    else:
+        pmf = np.zeros(size)
+        np.add.at(pmf, index, np.asarray(prob, dtype=float))
+        distribution = _power_float(pmf, n).tolist()
+
+    result = {}
+    for i, p in enumerate(distribution):
+        if p:
+            mean = low + step * i / n
+            result[mean if exact else float(mean)] = p
+    return result
+
+def median_distribution(
+    value: list[float],
+    prob: list[float],
+    n: int,
+    exact: bool = False
+) -> dict[Number, Number]:
+    """
+    exact distribution of the median of n iid draws from order statistics:
+    for odd n = 2m + 1 the median is X(m+1) with
+        P(X(m+1) <= v) = P(Binomial(n, F(v)) >= m + 1),
+    for even n = 2m it is (X(m) + X(m+1)) / 2 with, for a < b,
+        P(X(m) = a, X(m+1) = b) = C(n, m) (F(a)^m - F(a-)^m) (S(b)^(n-m) - S(b+)^(n-m))
+    where F is the cdf and S(b) = P(X >= b), and P(X(m) = X(m+1) = a) the remainder of P(X(m) = a)
+    Example
+        >>> median_distribution([0, 1], [0.5, 0.5], 3)
+        {0.0: 0.5, 1.0: 0.5}
+        >>> median_distribution([0, 1], [0.5, 0.5], 2, exact=True)
+        {Fraction(0, 1): Fraction(1, 4), Fraction(1, 2): Fraction(1, 2), Fraction(1, 1): Fraction(1, 4)}
+    """
+    assert len(value) == len(prob)
+    pmf = {}
+    for v, p in zip(value, prob):
+        v = _exact(v)
+        pmf[v] = pmf.get(v, 0) + (_exact(p) if exact else float(p))
+    support = sorted(pmf)
+    probabilities = [pmf[v] for v in support]
+    # below[k] = F(support[k]-), at_most[k] = F(support[k])
+    at_most = list(it.accumulate(probabilities))
+    below = [0] + at_most[:-1]
+    total = at_most[-1]
+    above = [total - f for f in at_most]  # S(v+)
+    from_ = [total - f for f in below]  # S(v)
+
+    def order_cdf(k: int, f) -> Number:
+        # P(X(k) <= v) when F(v) = f
+        return sum(math.comb(n, j) * f ** j * (total - f) ** (n - j) for j in range(k, n + 1))
+
+    result = {}
+    def add(key: Fraction, p) -> None:
+        if p:
+            key = key if exact else float(key)
+            result[key] = result.get(key, 0) + p
+
+    m = n // 2
+    if n % 2:
+        for v, f_below, f in zip(support, below, at_most):
+            add(v, order_cdf(m + 1, f) - order_cdf(m + 1, f_below))
+        return dict(sorted(result.items()))
+
+    lower = [f ** m - f_below ** m for f_below, f in zip(below, at_most)]
+    upper = [s ** (n - m) - s_above ** (n - m) for s, s_above in zip(from_, above)]
+    for a in range(len(support)):
+        split = 0
+        for b in range(a + 1, len(support)):
+            p = math.comb(n, m) * lower[a] * upper[b]
+            split += p
+            add((support[a] + support[b]) / 2, p)
+        add(support[a], order_cdf(m, at_most[a]) - order_cdf(m, below[a]) - split)
+    return dict(sorted(result.items()))
+
+class SamplingSummary:
+    """
+    streaming summary of the means and medians of sampled trials, merged chunk by chunk
+    row 0 of every array is about the sample mean, row 1 about the sample median
+    Instance Attributes:
+        - n: number of trials seen
+        - average: average of each statistic over the trials, shape (2,)
+        - sum_squares: sum of squared deviations from average (for the variance), shape (2,)
+        - histogram: counts of each statistic over bin_edges, shape (2, bins)
+    """
+    n: int
+    average: np.ndarray
+    sum_squares: np.ndarray
+    histogram: np.ndarray
+    bin_edges: np.ndarray
+
+    def __init__(self, bin_edges: np.ndarray) -> None:
+        self.n = 0
+        self.average = np.zeros(2)
+        self.sum_squares = np.zeros(2)
+        self.bin_edges = bin_edges
+        self.histogram = np.zeros((2, len(bin_edges) - 1), dtype=np.int64)
+
+    def add(self, samples: np.ndarray) -> None:
+        """
+        fold samples of shape (n_trials, n) into the summary, one trial per row
+        """
+        statistic = np.stack((samples.mean(axis=1), np.median(samples, axis=1)))
+        other = SamplingSummary(self.bin_edges)
+        other.n = samples.shape[0]
+        other.average = statistic.mean(axis=1)
+        other.sum_squares = ((statistic - other.average[:, None]) ** 2).sum(axis=1)
+        bins = len(self.bin_edges) - 1
+        index = np.clip(np.searchsorted(self.bin_edges, statistic, side="right") - 1, 0, bins - 1)
+        other.histogram = np.stack([np.bincount(row, minlength=bins) for row in index])
+        self.merge(other)
+
+    def merge(self, other: "SamplingSummary") -> None:
+        # pairwise update of the average and squared deviations (Chan et al.)
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.average - self.average
+        self.sum_squares += other.sum_squares + delta ** 2 * self.n * other.n / n
+        self.average += delta * other.n / n
+        self.n = n
+        self.histogram += other.histogram
+
+    @property
+    def variance(self) -> np.ndarray:
+        """
+        sample variance of the mean and of the median over the trials, shape (2,)
+        """
+        return self.sum_squares / max(self.n - 1, 1)
+
+    def distribution(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        bin centres and the estimated probability of each bin, shape (2, bins)
+        """
+        centres = (self.bin_edges[:-1] + self.bin_edges[1:]) / 2
+        return centres, self.histogram / max(self.n, 1)
+
+    def quantile(self, q: npt.ArrayLike) -> np.ndarray:
+        """
+        quantiles of the mean and of the median, resolved to the histogram bins,
+        shape (2, len(q))
+        """
+        return histogram_quantile(self.histogram, self.bin_edges, q).T
+
+def _sampling_chunk(
+    value: Union[np.ndarray, Callable[[np.random.Generator, tuple[int, int]], np.ndarray]],
+    prob: Optional[np.ndarray],
+    n: int,
+    n_trials: int,
+    seed: np.random.SeedSequence,
+    bin_edges: np.ndarray
+) -> SamplingSummary:
+    rng = np.random.default_rng(seed)
+    if callable(value):
+        samples = value(rng, (n_trials, n))
+    else:
+        samples = rng.choice(value, size=(n_trials, n), p=prob)
+    summary = SamplingSummary(bin_edges)
+    summary.add(samples)
+    return summary
+
+def sample_distribution(
+    value: Union[list[float], Callable[[np.random.Generator, tuple[int, int]], np.ndarray]],
+    prob: Optional[list[float]],
+    n: int,
+    n_trials: int,
+    value_range: Optional[tuple[float, float]] = None,
+    seed: Optional[int] = None,
+    processes: Optional[int] = None,
+    chunk_size: int = 10000,
+    bins: int = 256
+) -> Iterator[SamplingSummary]:
+    """
+    Monte Carlo estimate of the distributions of the mean and median of n iid draws,
+    for supports too large or continuous for mean_distribution / median_distribution
+    value is either a discrete support drawn with probabilities prob,
+    or a function draw(rng, shape) returning samples of a continuous distribution,
+    which must be picklable (defined at module level) to run on a process pool
+    n_trials trials are drawn in independently seeded chunks of chunk_size rows on a process pool,
+    the running SamplingSummary is yielded every time a chunk completes
+    so memory does not grow with n_trials
+    processes: pool size, None for one process per CPU, 0 runs everything in the current process
+    histograms cover value_range, by default the range of a discrete support
+    Example
+        >>> for summary in sample_distribution([15, 16, 17, 18], [0.1, 0.2, 0.3, 0.4], 3, 100000, seed=1, processes=0):
+        ...     pass
+        >>> summary.n, summary.average.round(1)
+        (100000, array([17. , 17.1]))
+    """
+    if callable(value):
+        if value_range is None:
+            raise ValueError("value_range is required when sampling from a function")
+    else:
+        value = np.asarray(value, dtype=float)
+        prob = None if prob is None else np.asarray(prob, dtype=float)
+        if value_range is None:
+            value_range = (value.min(), value.max())
+    low, high = value_range
+    bin_edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+
+    summary = SamplingSummary(bin_edges)
+    chunk_args = (
+        (value, prob, n, size, chunk_seed, bin_edges)
+        for size, chunk_seed in chunk_seeds(n_trials, chunk_size, seed)
+    )
+    for chunk in imap_chunks(_sampling_chunk, chunk_args, processes):
+        summary.merge(chunk)
+        yield summary
 
-mean_val, median_val, prob_dis = [], [], []
-for v, p in zip(it.product(value, repeat=3), it.product(prob, repeat=3)):
-    mean_val.append(round(sum(v) / 3, 3))
-    prob_dis.append(round(product(p), 3))
-    median_val.append(round(statistics.median(v), 3))
-    
+if __name__ == "__main__":
+    value = [15, 16, 17, 18]
+    prob = [0.1, 0.2, 0.3, 0.4]
 
-print(combine_dict(mean_val, prob_dis))
-print(combine_dict(median_val, prob_dis))
+    # every sample of size 3 as a row of indices into value
+    samples = np.indices((len(value),) * 3).reshape(3, -1).T
+    values, probs = np.asarray(value)[samples], np.asarray(prob)[samples].prod(axis=1)
+    print(group_sum(values.mean(axis=1), probs, decimals=3))
+    print(group_sum(np.median(values, axis=1), probs, decimals=3))
+    print(round_dict(mean_distribution(value, prob, 3)))
+    print(round_dict(median_distribution(value, prob, 3)))
+    for summary in sample_distribution(value, prob, 3, 10 ** 6, seed=0):
+        pass
+    print(summary.average, summary.variance)
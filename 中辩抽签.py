@@ -1,5 +1,8 @@
-import random
-
+import argparse
+import json
+from typing import Optional, Sequence
+import numpy as np
+from monte_carlo import chunk_seeds, imap_chunks
 
 
 __doc__ = """
@@ -24,11 +27,6 @@ groupNameToMembersMap: dict[str, tuple[str, str]] = {
     "猛犸象采茶叶": ("马铭轩", "曹楚依")
 }
 
-groupNameList: list[str] = [
-    "鸡蛋", "吴彦组", "无言以队", "有请下一队", "readers", "地衣", "宏玺说的都队", 
-    "好运来", "莎锅米线", "fate", "上一组", "上火", "嘉李伏尼亚", "猛犸象采茶叶"
-]
-
 timeList: list[str] = [
     "周五晚9点-10点",
     "周六晚8点-9点",
@@ -37,35 +35,342 @@ timeList: list[str] = [
     "周日晚9点-10点"
 ]
 
-random.shuffle(groupNameList)
-random.shuffle(groupNameList)
-random.shuffle(groupNameList)
-
-print("shuffled groupNameList: \n", groupNameList)
-for i in range(int(len(groupNameList) / 2)):
-    print(f"组号：{2 * i + 1}")
-    print(f"队伍名：{groupNameList[2 * i]}")
-    print("组员：", *groupNameToMembersMap[groupNameList[2 * i]])
-    print("持方：正")
-    print()
-    print(f"组号：{2 * i + 2}")
-    print(f"队伍名：{groupNameList[2 * i + 1]}")
-    print("组员：", *groupNameToMembersMap[groupNameList[2 * i + 1]])
-    print("持方：反")
-    print()
-
-
-print(
-f"""
-对阵规则：单持方，租号为[a]的组将分别与组号为[a-1]，以及[a+1]的组对战
-例子：
-组3 ({groupNameList[2]}) (正) 将分别对阵
-    组2 ({groupNameList[1]}) (反)
-    与
-    组4 ({groupNameList[3]}) (反)
-"""
-)
+def pair_teams(n_teams: int, rounds: int = 2, seed: Optional[int] = None) -> np.ndarray:
+    """
+    seeded round robin draw by the circle method on a shuffled order of the teams:
+    no two teams meet twice within n_teams - 1 rounds (n_teams rounds when n_teams is odd)
+    return team indices of shape (rounds, matches per round, 2), column 0 holds 正 and column 1 反;
+    with an odd number of teams one team per round has a bye, stored as (team, -1)
+    sides go to the team that has held 正 less often so far, so every team's
+    正 and 反 counts stay close
+    Example
+        >>> pairs = pair_teams(5, rounds=5, seed=0)
+        >>> pairs.shape
+        (5, 3, 2)
+        >>> sorted((pairs >= 0).all(axis=2).sum(axis=1).tolist())
+        [2, 2, 2, 2, 2]
+    """
+    size = n_teams + n_teams % 2
+    if not 0 < rounds <= max(size - 1, 1):
+        raise ValueError(f"rounds must be between 1 and {max(size - 1, 1)} for {n_teams} teams")
+    order = np.random.default_rng(seed).permutation(n_teams)
+    if size > n_teams:
+        order = np.append(order, -1)
+    return _seat_pairs(order[None], rounds)[0]
+
+
+def _seat_pairs(order: np.ndarray, rounds: int) -> np.ndarray:
+    """
+    pair_teams for a batch of shuffled orders of shape (n_draws, even size), -1 marking the bye
+    return shape (n_draws, rounds, size // 2, 2)
+    """
+    n_draws, size = order.shape
+    # order[:, 0] stays in place, the others rotate by one position every round
+    position = np.arange(size)
+    rotated = (position[None, 1:] - 1 + np.arange(rounds)[:, None]) % (size - 1) + 1
+    seats = order[:, np.concatenate((np.zeros((rounds, 1), dtype=np.intp), rotated), axis=1)]
+    half = size // 2
+    pairs = np.stack((seats[..., :half], seats[..., ::-1][..., :half]), axis=3)
+
+    balance = np.zeros((n_draws, size + 1), dtype=np.int64)  # 正 minus 反, the last entry for the bye
+    alternate = (np.arange(half) % 2).astype(bool)
+    rows = np.arange(n_draws)[:, None]
+    for r in range(rounds):
+        first, second = pairs[:, r, :, 0], pairs[:, r, :, 1]
+        balance_first, balance_second = balance[rows, first], balance[rows, second]
+        swap = (balance_first > balance_second) | (
+            (balance_first == balance_second) & (alternate ^ bool(r % 2))
+        )
+        bye = (first < 0) | (second < 0)
+        swap = np.where(bye, first < 0, swap)
+        pro, con = np.where(swap, second, first), np.where(swap, first, second)
+        pairs[:, r, :, 0], pairs[:, r, :, 1] = pro, con
+        played = ~bye
+        # teams are distinct within a round, so no index repeats in these updates
+        balance[rows, pro] += played
+        balance[rows, con] -= played
+    return pairs
+
+
+class DrawFairness:
+    """
+    counts over simulated draws of pair_teams, merged chunk by chunk
+    Instance Attributes:
+        - n: number of draws
+        - pro: matches each team played as 正, shape (n_teams,)
+        - matches: matches each team played, shape (n_teams,)
+        - byes: byes each team had, shape (n_teams,)
+        - opponents: number of draws in which team i met team j, shape (n_teams, n_teams)
+    """
+    n: int
+    pro: np.ndarray
+    matches: np.ndarray
+    byes: np.ndarray
+    opponents: np.ndarray
+
+    def __init__(self, n_teams: int) -> None:
+        self.n = 0
+        self.pro = np.zeros(n_teams, dtype=np.int64)
+        self.matches = np.zeros(n_teams, dtype=np.int64)
+        self.byes = np.zeros(n_teams, dtype=np.int64)
+        self.opponents = np.zeros((n_teams, n_teams), dtype=np.int64)
+
+    def add(self, pairs: np.ndarray) -> None:
+        """
+        fold draws of shape (n_draws, rounds, matches per round, 2) into the counts
+        """
+        n_teams = len(self.pro)
+        pro, con = pairs[..., 0], pairs[..., 1]
+        played = con >= 0
+        pro, con = pro[played], con[played]
+        self.n += pairs.shape[0]
+        self.pro += np.bincount(pro, minlength=n_teams)
+        self.matches += np.bincount(pro, minlength=n_teams) + np.bincount(con, minlength=n_teams)
+        self.byes += np.bincount(pairs[..., 0][~played], minlength=n_teams)
+        met = np.bincount(pro * n_teams + con, minlength=n_teams * n_teams).reshape(n_teams, n_teams)
+        self.opponents += met + met.T
+
+    def merge(self, other: "DrawFairness") -> None:
+        self.n += other.n
+        self.pro += other.pro
+        self.matches += other.matches
+        self.byes += other.byes
+        self.opponents += other.opponents
+
+    @property
+    def pro_fraction(self) -> np.ndarray:
+        """
+        share of each team's matches played as 正
+        """
+        return self.pro / np.maximum(self.matches, 1)
+
+    @property
+    def opponent_fraction(self) -> np.ndarray:
+        """
+        share of draws in which team i meets team j
+        """
+        return self.opponents / max(self.n, 1)
+
+    def pro_interval(self, z: float = 1.96) -> tuple[np.ndarray, np.ndarray]:
+        return _wilson(self.pro, self.matches, z)
+
+    def opponent_interval(self, z: float = 1.96) -> tuple[np.ndarray, np.ndarray]:
+        return _wilson(self.opponents, np.full(self.opponents.shape, self.n), z)
+
+
+def _wilson(successes: np.ndarray, trials: np.ndarray, z: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Wilson score interval of a binomial proportion
+    """
+    trials = np.maximum(trials, 1)
+    p = successes / trials
+    centre = (p + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    half_width = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / (1 + z ** 2 / trials)
+    return centre - half_width, centre + half_width
+
+
+def _fairness_chunk(n_teams: int, rounds: int, n_draws: int, seed: np.random.SeedSequence) -> DrawFairness:
+    rng = np.random.default_rng(seed)
+    order = rng.permuted(np.broadcast_to(np.arange(n_teams), (n_draws, n_teams)), axis=1)
+    if n_teams % 2:
+        order = np.concatenate((order, np.full((n_draws, 1), -1)), axis=1)
+    fairness = DrawFairness(n_teams)
+    fairness.add(_seat_pairs(order, rounds))
+    return fairness
+
+
+def draw_fairness(
+    n_teams: int,
+    rounds: int = 2,
+    n_draws: int = 10 ** 6,
+    seed: Optional[int] = None,
+    processes: Optional[int] = None,
+    chunk_size: int = 100000
+) -> DrawFairness:
+    """
+    simulate n_draws draws of pair_teams at once, permuting the teams of every draw
+    in one (chunk_size, n_teams) matrix, to check that no team is favoured in sides or opponents:
+    every pro_fraction should be close to 1/2, and every opponent_fraction off the diagonal
+    close to rounds / (n_teams - 1) (rounds / n_teams when n_teams is odd)
+    chunks are independently seeded and run on a process pool
+    processes: pool size, None for one process per CPU, 0 runs everything in the current process
+    Example
+        >>> fairness = draw_fairness(14, n_draws=20000, seed=0, processes=0)
+        >>> low, high = fairness.pro_interval()
+        >>> bool(((low < 0.5) & (0.5 < high)).all())
+        True
+    """
+    size = n_teams + n_teams % 2
+    if not 0 < rounds <= max(size - 1, 1):
+        raise ValueError(f"rounds must be between 1 and {max(size - 1, 1)} for {n_teams} teams")
+    fairness = DrawFairness(n_teams)
+    chunk_args = (
+        (n_teams, rounds, n, chunk_seed) for n, chunk_seed in chunk_seeds(n_draws, chunk_size, seed)
+    )
+    for chunk in imap_chunks(_fairness_chunk, chunk_args, processes):
+        fairness.merge(chunk)
+    return fairness
+
+
+def assign_slots(
+    pairs: np.ndarray,
+    team_members: Sequence[Sequence[str]],
+    n_slots: int,
+    per_slot: Optional[int] = None
+) -> np.ndarray:
+    """
+    give every match of pairs (see pair_teams) a time slot so that no team and no member
+    plays twice in one slot and no slot holds more than per_slot matches
+    matches are taken in round order, each slot greedily takes the earliest matches that
+    do not clash with one taken before them, looking 2 * per_slot pending matches ahead
+    return slot indices shaped like pairs[..., 0], -1 for byes and matches that did not fit
+    Example
+        >>> pairs = np.array([[[0, 1], [2, 3]], [[0, 2], [1, 3]]])
+        >>> assign_slots(pairs, [("a",), ("b",), ("c",), ("d",)], 4)
+        array([[0, 0],
+               [1, 1]])
+        >>> assign_slots(pairs, [("a",), ("b",), ("a",), ("d",)], 4)
+        array([[0, 1],
+               [2, 2]])
+        >>> assign_slots(np.array([[[0, 1], [1, 2], [2, 3]]]), [(), (), (), ()], 3)
+        array([[0, 1, 0]])
+    """
+    n_teams = len(team_members)
+    members = {name: n_teams + i for i, name in enumerate(sorted({m for ms in team_members for m in ms}))}
+    # each team is also its own member so a team never plays twice in a slot
+    team_ids = [np.array([team] + [members[m] for m in ms], dtype=np.intp) for team, ms in enumerate(team_members)]
+    team_count = np.array([len(ids) for ids in team_ids])
+    team_start = np.concatenate(([0], np.cumsum(team_count)))
+    team_flat = np.concatenate(team_ids)
+
+    flat_pairs = pairs.reshape(-1, 2)
+    slots = np.full(len(flat_pairs), -1, dtype=np.int64)
+    order = np.flatnonzero((flat_pairs >= 0).all(axis=1))
+    # a slot never holds more than one round's worth of matches
+    per_slot = min(per_slot or pairs.shape[1], pairs.shape[1])
+    window = 2 * per_slot
+    pending = np.empty(0, dtype=np.intp)
+    start = 0
+    for slot in range(n_slots):
+        need = window - len(pending)
+        batch = np.concatenate((pending, order[start:start + need]))
+        start += min(need, len(order) - start)
+        if batch.size == 0:
+            break
+        # the members of every match in batch, flattened in batch order
+        teams = flat_pairs[batch]
+        count = team_count[teams].sum(axis=1)
+        match_start = np.concatenate(([0], np.cumsum(count)[:-1]))
+        team_entries = team_count[teams.ravel()]
+        entries = np.arange(team_entries.sum()) + np.repeat(
+            team_start[teams.ravel()] - (np.cumsum(team_entries) - team_entries), team_entries
+        )
+        member = team_flat[entries]
+        match = np.repeat(np.arange(len(batch)), count)
+        member = np.unique(member, return_inverse=True)[1]
+        # decide matches in rounds: a match is taken once it is the first undecided match
+        # for each of its members, rejected once it shares a member with a taken one
+        taken_member = np.zeros(member.max() + 1, dtype=bool)
+        taken = np.zeros(len(batch), dtype=bool)
+        undecided = np.ones(len(batch), dtype=bool)
+        while undecided.any():
+            clash = np.zeros(len(batch), dtype=bool)
+            clash[match[taken_member[member]]] = True
+            undecided &= ~clash
+            entry = np.flatnonzero(undecided[match])
+            if entry.size == 0:
+                break
+            _, first, inverse = np.unique(member[entry], return_index=True, return_inverse=True)
+            blocked = np.zeros(len(batch), dtype=bool)
+            blocked[match[entry][match[entry][first][inverse] != match[entry]]] = True
+            free = undecided & ~blocked
+            taken |= free
+            undecided &= ~free
+            taken_member[member[free[match]]] = True
+            # only the first per_slot taken matches are used, later decisions cannot change them
+            first_undecided = undecided.argmax() if undecided.any() else len(batch)
+            if np.count_nonzero(taken[:first_undecided]) >= per_slot:
+                break
+        taken &= np.cumsum(taken) <= per_slot
+        slots[batch[taken]] = slot
+        pending = batch[~taken]
+    return slots.reshape(pairs.shape[:2])
+
+
+def schedule(
+    teams: dict[str, Sequence[str]],
+    slots: Sequence[str],
+    rounds: int = 2,
+    per_slot: Optional[int] = None,
+    seed: Optional[int] = None
+) -> list[dict]:
+    """
+    seeded draw of the teams (name -> members) into rounds of matches assigned to time slots
+    return one record per match with keys round, slot, pro (正), con (反), pro_members, con_members;
+    slot is None when the slots ran out, con is None for a bye
+    Example
+        >>> records = schedule({"a": ("1",), "b": ("2",), "c": ("3",)}, ["Fri", "Sat"], seed=1)
+        >>> [(r["round"], r["slot"], r["pro"], r["con"]) for r in records]
+        [(1, None, 'a', None), (1, 'Fri', 'c', 'b'), (2, 'Sat', 'b', 'a'), (2, None, 'c', None)]
+    """
+    names = list(teams)
+    team_members = [tuple(teams[name]) for name in names]
+    pairs = pair_teams(len(names), rounds, seed)
+    slot_index = assign_slots(pairs, team_members, len(slots), per_slot)
+    records = []
+    for r in range(pairs.shape[0]):
+        for (pro, con), slot in zip(pairs[r].tolist(), slot_index[r].tolist()):
+            records.append({
+                "round": r + 1,
+                "slot": slots[slot] if slot >= 0 else None,
+                "pro": names[pro],
+                "con": names[con] if con >= 0 else None,
+                "pro_members": list(team_members[pro]),
+                "con_members": list(team_members[con]) if con >= 0 else [],
+            })
+    return records
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="中辩抽签")
+    parser.add_argument("--seed", type=int, help="seed of the draw, the same seed gives the same schedule")
+    parser.add_argument("--rounds", type=int, default=2, help="matches per team")
+    parser.add_argument("--per-slot", type=int, help="most matches in one time slot")
+    parser.add_argument("--json", action="store_true", help="print the schedule as JSON")
+    parser.add_argument(
+        "--fairness", type=int, metavar="N_DRAWS",
+        help="simulate N_DRAWS draws and print how often each team holds 正 and meets each opponent"
+    )
+    args = parser.parse_args(argv)
+
+    if args.fairness:
+        names = list(groupNameToMembersMap)
+        fairness = draw_fairness(len(names), args.rounds, args.fairness, args.seed)
+        low, high = fairness.pro_interval()
+        opponent_low, opponent_high = fairness.opponent_interval()
+        np.fill_diagonal(opponent_low, np.inf)
+        np.fill_diagonal(opponent_high, -np.inf)
+        print(f"{fairness.n} 次抽签, 每对队伍相遇的概率期望 {args.rounds / (len(names) - 1 + len(names) % 2):.4f}")
+        for i, name in enumerate(names):
+            print(
+                f"{name}: 正方比例 {fairness.pro_fraction[i]:.4f} [{low[i]:.4f}, {high[i]:.4f}], "
+                f"相遇概率 [{opponent_low[i].min():.4f}, {opponent_high[i].max():.4f}]"
+            )
+        return
+
+    records = schedule(groupNameToMembersMap, timeList, args.rounds, args.per_slot, args.seed)
+    if args.json:
+        print(json.dumps(records, ensure_ascii=False, indent=2))
+        return
+    for record in records:
+        print(f"第{record['round']}轮 时间：{record['slot'] or '待定'}")
+        print(f"正：{record['pro']}  组员：", *record["pro_members"])
+        if record["con"] is None:
+            print("轮空")
+        else:
+            print(f"反：{record['con']}  组员：", *record["con_members"])
+        print()
 
 
-# Update Result
-groupNameList = ...
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,330 @@
-
-#使用说明：这是个第五人格排位加分计算器，只需要胜率即可算出您的排位效率（局平均加分）。
-#此加分仅供参考，适用于四阶及以上无段位保护分的玩家，不限阵营。
-print("#使用说明：这是个第五人格排位加分计算器，只需要胜率即可算出您的排位效率（局平均加分）。")
-print("#此加分仅供参考，适用于四阶及以上无段位保护分的玩家，不限阵营。")
-print("#q求生者方可能会有1.5分的平均偏差，因为系统忽略了地窖和四出分并设定演绎分默认值为2.5每局。监管者可能有一分偏差。")
-list=[100] #possible outcome
-lista=[100] #win number
-listb=[100] #total win+lost
-Flist=[] #Final list
-b=1
-while b<101:
-    a=0
-    while a<b:
-        r=round(10000*a/b)/100
-        list.append(r)
-        lista.append(a)
-        listb.append(b)
-        a+=1
-    b+=1
-
-
-#Useless-
-def sortlist(list0):
-    list0.sort()
-    last=list0[-1]
-    for i in range(len(list0)-2,-1,-1):
-        if list0[i]==last:
-            list0.remove(list0[i])
-        else:
-            last=list0[i]
-    return list0
-#-
-
-print(list)
-print(lista)
-print(listb)
-blist=sorted(list)
-k=float(input("胜率？"))
-w=list.index(k) #find input from total
-P=list.count(k)
-print("Possible Combinations:",P)
-Type=str(input("S(求生者) or H(监管者)"))
-print(Type)
-count=1
-while count<P+1:
-    if Type=="S":
-        AvF=(lista[w]*count*8-(listb[w]-lista[w])*count*7+(100-count*listb[w])*2+250)/100
-    elif Type=="H":
-        AvF=(lista[w]*count*12-(listb[w]-lista[w])*count*6+(100-count*listb[w])*3.5)/100
-    else:
-        AvF=0
-    print("Win(赢):",lista[w]*count,"Lost(输):",(listb[w]-lista[w])*count,"Tie(平):",100-count*listb[w],"AvF(平均加分)=",AvF)
-    Flist.append(AvF)
-    count+=1
-print("Max Average:",max(Flist))
-print("Min Average:",min(Flist))
-
+
+#使用说明：这是个第五人格排位加分计算器，只需要胜率即可算出您的排位效率（局平均加分）。
+#此加分仅供参考，适用于四阶及以上无段位保护分的玩家，不限阵营。
+import argparse
+import csv
+import sys
+from typing import Optional, Sequence
+import numpy as np
+import numpy.typing as npt
+
+GAMES = 100  # games behind every average
+# points per win, per loss, per tie, and bonus per GAMES games (the survivor's 2.5 per game for 演绎分)
+SCORE_RULES: dict[str, tuple[float, float, float, float]] = {
+    "S": (8, -7, 2, 250),
+    "H": (12, -6, 3.5, 0),
+}
+
+
+def _win_table() -> tuple[np.ndarray, np.ndarray]:
+    """
+    wins and decisive games (wins + losses) of the smallest record with a given win rate,
+    indexed by the win rate in hundredths of a percent, 0 games where no record has that rate
+    """
+    wins = np.zeros(100 * 100 + 1, dtype=np.int64)
+    games = np.zeros(100 * 100 + 1, dtype=np.int64)
+    # all wins only counts as 100 wins out of 100 games
+    wins[-1] = games[-1] = GAMES
+    for b in range(GAMES, 0, -1):
+        a = np.arange(b)
+        key = np.round(10000 * a / b).astype(np.int64)
+        # going down from b = GAMES, the smallest b writes last
+        wins[key], games[key] = a, b
+    return wins, games
+
+
+_WINS, _GAMES = _win_table()
+
+
+def win_record(win_rates: npt.ArrayLike) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (wins, wins + losses) of the smallest record of each win rate in percent, rounded to 2 decimals,
+    0 games for a rate no record of at most GAMES games gives
+    Example
+        >>> win_record([50, 33.33, 100])
+        (array([  1,   1, 100]), array([  2,   3, 100]))
+    """
+    key = np.round(np.asarray(win_rates, dtype=float) * 100)
+    valid = (key >= 0) & (key <= 10000)
+    key = np.where(valid, key, 0).astype(np.int64)
+    return np.where(valid, _WINS[key], 0), np.where(valid, _GAMES[key], 0)
+
+
+def rank_scores(
+    win_rates: npt.ArrayLike,
+    roles: npt.ArrayLike
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    lowest and highest average points per game of every player, for win rates in percent
+    and roles S (求生者) or H (监管者)
+    a win rate a / b is played as a * count wins and (b - a) * count losses over GAMES games,
+    the remaining games tied, for every count that fits; the average is linear in count,
+    so its extremes are at count = 1 and count = GAMES // b
+    other roles score 0, unknown win rates NaN
+    Example
+        >>> rank_scores([50, 60], ["S", "H"])
+        (array([3.   , 3.565]), array([4.47, 4.8 ]))
+    """
+    wins, games = win_record(win_rates)
+    roles = np.asarray(roles)
+    win_points, loss_points, tie_points, bonus = (
+        np.select([roles == role for role in SCORE_RULES], column, 0.)
+        for column in zip(*SCORE_RULES.values())
+    )
+    losses = games - wins
+    # points of one (wins, losses) block compared to tying those games instead
+    block = wins * win_points + losses * loss_points - games * tie_points
+    base = GAMES * tie_points + bonus
+    count = np.maximum(GAMES // np.maximum(games, 1), 1)
+    with np.errstate(invalid="ignore"):
+        first, last = (base + block) / GAMES, (base + count * block) / GAMES
+        unknown = games == 0
+        low = np.where(unknown, np.nan, np.minimum(first, last))
+        high = np.where(unknown, np.nan, np.maximum(first, last))
+    return low, high
+
+
+def score_combinations(win_rate: float, role: str) -> list[tuple[int, int, int, float]]:
+    """
+    every (wins, losses, ties, average points per game) over GAMES games with this win rate
+    """
+    wins, games = (int(x[0]) for x in win_record([win_rate]))
+    if games == 0:
+        raise ValueError(f"No record of at most {GAMES} games has a win rate of {win_rate}")
+    win_points, loss_points, tie_points, bonus = SCORE_RULES.get(role, (0, 0, 0, 0))
+    combinations = []
+    for count in range(1, GAMES // games + 1):
+        win, loss = wins * count, (games - wins) * count
+        tie = GAMES - win - loss
+        average = (win * win_points + loss * loss_points + tie * tie_points + bonus) / GAMES
+        combinations.append((win, loss, tie, average))
+    return combinations
+
+
+class LadderResult:
+    """
+    ladder trajectories of simulated players, one entry per player
+    Instance Attributes:
+        - games: games played until reaching the target, falling to the floor, or max_games
+        - reached: whether the player reached the target
+        - fell: whether the player fell to the floor
+        - peak: highest score along the way, the start included
+        - trough: lowest score along the way, the start included
+        - final: score after the last game played
+    """
+    games: np.ndarray
+    reached: np.ndarray
+    fell: np.ndarray
+    peak: np.ndarray
+    trough: np.ndarray
+    final: np.ndarray
+
+    def __init__(self, n_players: int) -> None:
+        self.games = np.zeros(n_players, dtype=np.int64)
+        self.reached = np.zeros(n_players, dtype=bool)
+        self.fell = np.zeros(n_players, dtype=bool)
+        self.peak = np.zeros(n_players)
+        self.trough = np.zeros(n_players)
+        self.final = np.zeros(n_players)
+
+    @property
+    def reach_fraction(self) -> float:
+        return float(self.reached.mean()) if len(self.reached) else 0.
+
+    def games_distribution(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        games needed to reach the target and the share of all players needing each
+        """
+        counts = np.bincount(self.games[self.reached])
+        games = np.flatnonzero(counts)
+        return games, counts[games] / max(len(self.games), 1)
+
+    def games_quantile(self, q: npt.ArrayLike) -> np.ndarray:
+        """
+        quantiles of the games to target among the players who reached it
+        """
+        return np.quantile(self.games[self.reached], q) if self.reached.any() else np.full(np.shape(q), np.nan)
+
+
+def simulate_ladder(
+    n_players: int,
+    win_rate: npt.ArrayLike,
+    role: npt.ArrayLike,
+    target: float,
+    start: float = 0.,
+    floor: Optional[float] = None,
+    tie_rate: npt.ArrayLike = 0.,
+    max_games: int = 10000,
+    seed: Optional[int] = None,
+    block: int = 32,
+    chunk_size: int = 1 << 16
+) -> LadderResult:
+    """
+    random walks of n_players players on the ladder, each game a win with probability win_rate,
+    a tie with probability tie_rate and a loss otherwise, both in percent of all games,
+    scored by SCORE_RULES (the survivor bonus included) from start until the score reaches target,
+    falls to floor or max_games are played
+    win_rate, role and tie_rate are shared by all players or given per player
+    players are simulated chunk_size at a time, block games at once from one cumulative sum
+    Example
+        >>> result = simulate_ladder(10000, 50, "H", target=100, seed=0)
+        >>> result.reach_fraction, int(result.games_quantile(0.5))
+        (1.0, 31)
+    """
+    win_rate = np.broadcast_to(np.asarray(win_rate, dtype=float) / 100, (n_players,))
+    tie_rate = np.broadcast_to(np.asarray(tie_rate, dtype=float) / 100, (n_players,))
+    role = np.broadcast_to(np.asarray(role), (n_players,))
+    # points of a win, a tie and a loss in half points, so scores stay integers
+    win_points, loss_points, tie_points, bonus = (
+        np.select([role == r for r in SCORE_RULES], column, 0.)
+        for column in zip(*SCORE_RULES.values())
+    )
+    bonus = bonus / GAMES
+    points = np.stack((win_points + bonus, tie_points + bonus, loss_points + bonus), axis=1)
+    half_points = np.round(2 * points).astype(np.int32)
+    if not np.allclose(half_points, 2 * points):
+        raise ValueError("Score rules must be multiples of a half point")
+    start_half = round(2 * start)
+    target_half = int(np.ceil(2 * target))
+    floor_half = int(np.floor(2 * floor)) if floor is not None else None
+
+    result = LadderResult(n_players)
+    rng = np.random.default_rng(seed)
+    for chunk_start in range(0, n_players, chunk_size):
+        chunk = slice(chunk_start, min(chunk_start + chunk_size, n_players))
+        _ladder_chunk(
+            result, chunk, win_rate[chunk], tie_rate[chunk], half_points[chunk],
+            start_half, target_half, floor_half, max_games, block, rng
+        )
+    result.peak /= 2
+    result.trough /= 2
+    result.final /= 2
+    return result
+
+
+def _ladder_chunk(
+    result: LadderResult,
+    chunk: slice,
+    win_rate: np.ndarray,
+    tie_rate: np.ndarray,
+    half_points: np.ndarray,
+    start: int,
+    target: int,
+    floor: Optional[int],
+    max_games: int,
+    block: int,
+    rng: np.random.Generator
+) -> None:
+    index = np.arange(chunk.start, chunk.stop)
+    score = np.full(len(index), start, dtype=np.int32)
+    peak, trough = score.copy(), score.copy()
+    win_rate = win_rate[:, None].astype(np.float32)
+    tie_rate = win_rate + tie_rate[:, None].astype(np.float32)
+    played = 0
+    while len(index) and played < max_games:
+        size = min(block, max_games - played)
+        draw = rng.random((len(index), size), dtype=np.float32)
+        # outcome 0 win, 1 tie, 2 loss, looked up in each player's row of half_points
+        row = (3 * np.arange(len(index)))[:, None]
+        step = half_points.ravel()[row + (draw >= win_rate) + (draw >= tie_rate)]
+        path = np.cumsum(step, axis=1, dtype=np.int32)
+        path += score[:, None]
+        hit = path >= target
+        if floor is not None:
+            hit |= path <= floor
+        stopped = hit.any(axis=1)
+        # games played in this block: up to the first hit, or all of them
+        games = np.where(stopped, hit.argmax(axis=1) + 1, size)
+        block_peak, block_trough = path.max(axis=1), path.min(axis=1)
+        if stopped.any():
+            # games after the first hit are never played
+            until_hit = path[stopped]
+            until_hit = np.where(np.arange(size) < games[stopped, None], until_hit, until_hit[:, :1])
+            block_peak[stopped], block_trough[stopped] = until_hit.max(axis=1), until_hit.min(axis=1)
+        peak, trough = np.maximum(peak, block_peak), np.minimum(trough, block_trough)
+        score = path[np.arange(len(index)), games - 1]
+        played += size
+
+        done = stopped | (played >= max_games)
+        finished = index[done]
+        result.games[finished] = played - size + games[done]
+        result.reached[finished] = score[done] >= target
+        result.fell[finished] = (score[done] <= floor) if floor is not None else False
+        result.peak[finished] = peak[done]
+        result.trough[finished] = trough[done]
+        result.final[finished] = score[done]
+        keep = ~done
+        index, score, peak, trough = index[keep], score[keep], peak[keep], trough[keep]
+        win_rate, tie_rate, half_points = win_rate[keep], tie_rate[keep], half_points[keep]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="第五人格排位加分计算器")
+    parser.add_argument("win_rates", nargs="*", type=float, help="win rates in percent")
+    parser.add_argument("--role", nargs="+", default=["S"], help="S(求生者) or H(监管者), one for all or one per win rate")
+    parser.add_argument("--csv", help="read win_rate,role rows from a CSV file ('-' for stdin)")
+    parser.add_argument(
+        "--ladder", type=float, metavar="TARGET",
+        help="simulate players with the first win rate and role until they gain TARGET points"
+    )
+    parser.add_argument("--players", type=int, default=10 ** 6, help="players simulated with --ladder")
+    parser.add_argument("--tie-rate", type=float, default=0., help="tie rate in percent for --ladder")
+    parser.add_argument("--floor", type=float, help="points lost at which a simulated player stops")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    if args.ladder is not None:
+        if not args.win_rates:
+            parser.error("--ladder needs a win rate")
+        result = simulate_ladder(
+            args.players, args.win_rates[0], args.role[0], args.ladder,
+            floor=-args.floor if args.floor is not None else None,
+            tie_rate=args.tie_rate, seed=args.seed
+        )
+        print(f"reached {args.ladder} points: {result.reach_fraction:.2%}, fell: {result.fell.mean():.2%}")
+        for q, games in zip((0.1, 0.5, 0.9), result.games_quantile([0.1, 0.5, 0.9])):
+            print(f"games to target, {q:.0%} quantile: {games:g}")
+        print(f"mean peak {result.peak.mean():.2f}, mean trough {result.trough.mean():.2f}")
+        return
+
+    if args.csv:
+        with (sys.stdin if args.csv == "-" else open(args.csv, newline="")) as file:
+            rows = [row for row in csv.reader(file) if row]
+        if rows and rows[0][0].strip().lower() == "win_rate":
+            rows = rows[1:]
+        win_rates = [float(row[0]) for row in rows]
+        roles = [row[1].strip() for row in rows]
+    elif args.win_rates:
+        win_rates = args.win_rates
+        roles = args.role * len(win_rates) if len(args.role) == 1 else args.role
+        if len(roles) != len(win_rates):
+            parser.error("give one role, or one role per win rate")
+    else:
+        interactive()
+        return
+
+    low, high = rank_scores(win_rates, roles)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["win_rate", "role", "min_average", "max_average"])
+    writer.writerows(zip(win_rates, roles, low.round(4).tolist(), high.round(4).tolist()))
+
+
+def interactive() -> None:
+    print("#使用说明：这是个第五人格排位加分计算器，只需要胜率即可算出您的排位效率（局平均加分）。")
+    print("#此加分仅供参考，适用于四阶及以上无段位保护分的玩家，不限阵营。")
+    print("#q求生者方可能会有1.5分的平均偏差，因为系统忽略了地窖和四出分并设定演绎分默认值为2.5每局。监管者可能有一分偏差。")
+    k = float(input("胜率？"))
+    combinations = score_combinations(k, "S")
+    print("Possible Combinations:", len(combinations))
+    Type = str(input("S(求生者) or H(监管者)"))
+    print(Type)
+    Flist = []  # Final list
+    for win, loss, tie, AvF in score_combinations(k, Type):
+        print("Win(赢):", win, "Lost(输):", loss, "Tie(平):", tie, "AvF(平均加分)=", AvF)
+        Flist.append(AvF)
+    print("Max Average:", max(Flist))
+    print("Min Average:", min(Flist))
+
+
+if __name__ == "__main__":
+    main()